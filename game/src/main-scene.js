@@ -1,12 +1,21 @@
 import _ from "lodash";
 import Phaser from "phaser";
 
-import { connect, send } from "ws-client";
+import { connect, isBinary, send } from "ws-client";
+import { encodeGameUpdate } from "wire-format";
 import { GAME_WIDTH, GAME_HEIGHT } from "game-constants";
 
 class MainScene extends Phaser.Scene {
   PLAYER_WS_HOST = "localhost";
   PLAYER_WS_PORT = 1530;
+  // Send game updates at most this often (ms), instead of every frame. The
+  // player only uses the latest one per measurement (every 10ms).
+  GAME_UPDATE_MIN_INTERVAL = 10;
+  // Whether to skip sending a game update if the game state hasn't changed
+  // since the last one sent. Even so, send one at least this often (ms), e.g.
+  // so a player that just connected gets the game state.
+  SEND_GAME_UPDATES_ONLY_ON_CHANGE = true;
+  GAME_UPDATE_MAX_INTERVAL = 1000;
 
   /* MAIN PHASER METHODS */
 
@@ -68,6 +77,10 @@ class MainScene extends Phaser.Scene {
     this.moveControls = this.input.keyboard.createCursorKeys();
     this.queuedCommands = {};
 
+    /* Game updates sent to the player */
+    this.lastGameUpdateSentTime = -Infinity;
+    this.lastGameStateSent = null;
+
     /* Connect to Player WebSocket server */
     connect({
       host: this.PLAYER_WS_HOST,
@@ -104,9 +117,9 @@ class MainScene extends Phaser.Scene {
           commandIds,
           (commandId) => this.queuedCommands[commandId]
         );
-        const latestCommand = _.maxBy(
-          commands,
-          ({ timestring }) => new Date(timestring)
+        // Binary commands have a numeric timestamp, JSON ones a timestring.
+        const latestCommand = _.maxBy(commands, ({ timestamp, timestring }) =>
+          timestamp !== undefined ? timestamp : new Date(timestring).getTime()
         );
         direction.x = latestCommand.move.x;
         direction.y = -latestCommand.move.y;
@@ -193,7 +206,14 @@ class MainScene extends Phaser.Scene {
   sendGameStateUpdateMsg = () => {
     /* Construct a summary object of the game state (player position, target
       position, etc.) and send it to the Player component via WebSocket.
+
+      Sends at most once per GAME_UPDATE_MIN_INTERVAL, and (if
+      SEND_GAME_UPDATES_ONLY_ON_CHANGE) only if the game state changed.
     */
+    const now = Date.now();
+    if (now - this.lastGameUpdateSentTime < this.GAME_UPDATE_MIN_INTERVAL) {
+      return;
+    }
     const gameState = {
       playerCursor: {
         x: this.playerCursor.body.x,
@@ -207,12 +227,28 @@ class MainScene extends Phaser.Scene {
       },
       isCalibrating: this.isCalibrating,
     };
-    const timestring = new Date().toISOString().replace("Z", "+00:00");
-    const gameStateMsg = {
-      TYPE: "GAME_UPDATE",
-      PAYLOAD: { gameState, timestring },
-    };
-    send(JSON.stringify(gameStateMsg));
+    if (
+      this.SEND_GAME_UPDATES_ONLY_ON_CHANGE &&
+      now - this.lastGameUpdateSentTime < this.GAME_UPDATE_MAX_INTERVAL &&
+      _.isEqual(gameState, this.lastGameStateSent)
+    ) {
+      return;
+    }
+    let wasSent;
+    if (isBinary()) {
+      wasSent = send(encodeGameUpdate(gameState, now));
+    } else {
+      const timestring = new Date().toISOString().replace("Z", "+00:00");
+      const gameStateMsg = {
+        TYPE: "GAME_UPDATE",
+        PAYLOAD: { gameState, timestring },
+      };
+      wasSent = send(JSON.stringify(gameStateMsg));
+    }
+    if (wasSent) {
+      this.lastGameUpdateSentTime = now;
+      this.lastGameStateSent = gameState;
+    }
   };
 }
 
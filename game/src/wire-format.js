@@ -0,0 +1,61 @@
+/* Compact binary format for the high-frequency messages (GAME_UPDATE and
+  GAME_COMMAND), used when the player's WebSocket server agrees to the binary
+  subprotocol. See the WebSocket API section of player/README.md for the
+  layouts. All fields are little-endian.
+*/
+
+export const BINARY_SUBPROTOCOL = "decoder-game-binary-v1";
+export const JSON_SUBPROTOCOL = "decoder-game-json";
+// In order of preference.
+export const SUBPROTOCOLS = [BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL];
+
+const GAME_UPDATE_CODE = 1;
+const GAME_COMMAND_CODE = 2;
+const IS_CALIBRATING_FLAG = 0b1;
+const GAME_UPDATE_SIZE = 36;
+
+export const encodeGameUpdate = (gameState, timestamp) => {
+  /* Make a binary GAME_UPDATE frame.
+
+  :param object gameState: see README.md
+  :param number timestamp: ms since the Unix epoch
+
+  :return ArrayBuffer:
+  */
+  const { playerCursor, target, isCalibrating } = gameState;
+  const buffer = new ArrayBuffer(GAME_UPDATE_SIZE);
+  const view = new DataView(buffer);
+  view.setUint8(0, GAME_UPDATE_CODE);
+  view.setUint8(1, isCalibrating ? IS_CALIBRATING_FLAG : 0);
+  view.setFloat64(4, timestamp, true);
+  view.setFloat32(12, playerCursor.x, true);
+  view.setFloat32(16, playerCursor.y, true);
+  view.setFloat32(20, playerCursor.radius, true);
+  view.setFloat32(24, target.x, true);
+  view.setFloat32(28, target.y, true);
+  view.setFloat32(32, target.radius, true);
+  return buffer;
+};
+
+export const decodeMessage = (buffer) => {
+  /* Turn a binary frame into the same kind of object a JSON message is parsed
+    into. The PAYLOAD of a GAME_COMMAND has "timestamp" (ms since the Unix
+    epoch) instead of "timestring".
+
+  :param ArrayBuffer buffer:
+
+  :return object msgObj: with TYPE and PAYLOAD
+  */
+  const view = new DataView(buffer);
+  const typeCode = view.getUint8(0);
+  if (typeCode === GAME_COMMAND_CODE) {
+    return {
+      TYPE: "GAME_COMMAND",
+      PAYLOAD: {
+        timestamp: view.getFloat64(4, true),
+        move: { x: view.getFloat32(12, true), y: view.getFloat32(16, true) },
+      },
+    };
+  }
+  throw `Unrecognized binary message type code: ${typeCode}`;
+};
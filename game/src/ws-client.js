@@ -1,28 +1,51 @@
+import { BINARY_SUBPROTOCOL, SUBPROTOCOLS, decodeMessage } from "wire-format";
+
 let ws = null;
 
 export const connect = ({ host, port, handleMessage }) => {
   console.info("Attempting connection to player ws server...");
-  ws = new WebSocket(`ws://${host}:${port}`);
+  // Offer the binary subprotocol. If the server doesn't agree to it, everything
+  // is JSON.
+  ws = new WebSocket(`ws://${host}:${port}`, SUBPROTOCOLS);
+  ws.binaryType = "arraybuffer";
 
   ws.onopen = () => {
-    console.info("Connection to player ws server opened.");
+    console.info(
+      `Connection to player ws server opened (subprotocol: ${ws.protocol}).`
+    );
   };
 
   if (handleMessage) {
     ws.onmessage = (event) => {
-      const msgObj = JSON.parse(event.data);
+      const msgObj =
+        event.data instanceof ArrayBuffer
+          ? decodeMessage(event.data)
+          : JSON.parse(event.data);
       handleMessage(msgObj);
     };
   }
 
   ws.onclose = () => {
     console.info("Connection to player ws server closed.");
-    connect({ host, port, onmessage });
+    connect({ host, port, handleMessage });
   };
 };
 
+export const isBinary = () => {
+  /* Whether the current connection uses the binary format for GAME_UPDATE and
+    GAME_COMMAND messages.
+  */
+  return Boolean(ws && ws.protocol === BINARY_SUBPROTOCOL);
+};
+
 export const send = (...args) => {
+  /* Send a message, if connected.
+
+  :return bool wasSent:
+  */
   if (ws && ws.readyState === 1) {
     ws.send(...args);
+    return true;
   }
+  return false;
 };
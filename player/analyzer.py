@@ -1,51 +1,196 @@
 import os
+import re
 import json
-from datetime import datetime
+import argparse
+from datetime import datetime, timezone
 import code
 
-from player import LOG_FILE_PATH
+import numpy as np
+
+from constants import LOG_FILE_PATH, DECODER_SNAPSHOT_DIR_PATH
 from decoder import Decoder
+from features import FeatureExtractor
+from session_log import INDEX_FILE_NAME, readLogIndex, loadRun, getRunStartTime
+
+
+# Find the playerId and time of a line of a JSON log file, without parsing the whole
+# line (like evaluate.PLAYER_ID_PATTERN).
+PLAYER_ID_PATTERN = re.compile(r'"playerId": "([^"]+)"')
+TIMESTRING_PATTERN = re.compile(r'"timestring": "([^"]+)"')
 
 
 def getLatestLogFile():
     """Get the latest log file (usually today's log file) in our log folder.
 
-    :return str fileName: E.g. "2020-12-29.txt"
+    :return str|None fileName: E.g. "2020-12-29.txt", or None if there are none
     """
     logDirName = os.path.dirname(LOG_FILE_PATH)
     fileNames = os.listdir(logDirName)
     # Our log files are named in the format "YYYY-MM-DD.txt" so later dates are greater
     # strings according to Python.
     logFileNames = [f for f in fileNames if f.endswith(".txt")]
+    if not logFileNames:
+        return None
     latestLogFileName = max(logFileNames)
     latestLogFilePath = os.path.join(logDirName, latestLogFileName)
     return latestLogFilePath
 
 
-def main():
-    # Get the latest log file.
-    latestLogFile = getLatestLogFile()
-    # Read the last line of the file to see the playerId of the latest run.
-    with open(latestLogFile, "r") as f:
+def getLatestBinaryLogDir():
+    """Get the latest folder of binary logs (see session_log.BinarySessionLog) in our
+    log folder, if there are any.
+
+    :return str|None dirPath: E.g. "log/2020-12-29"
+    """
+    logDirName = os.path.dirname(LOG_FILE_PATH)
+    # These folders are named in the format "YYYY-MM-DD", like the JSON log files.
+    binaryLogDirNames = [
+        d
+        for d in os.listdir(logDirName)
+        if os.path.isfile(os.path.join(logDirName, d, INDEX_FILE_NAME))
+    ]
+    if not binaryLogDirNames:
+        return None
+    return os.path.join(logDirName, max(binaryLogDirNames))
+
+
+def getLatestJsonRun(logFile):
+    """Find the latest run in a JSON log file, and when it started.
+
+    :param str logFile: path of the log file
+
+    :return (str, datetime)|None: playerId of the latest run (the one logged last) and
+        the time of its first log, or None if the file is empty
+    """
+    runStartTimes = {}
+    latestPlayerId = None
+    with open(logFile, "r") as f:
         for line in f:
-            pass
-        lastLog = json.loads(line)
-        latestPlayerId = lastLog["playerId"]
-    # Load from the file all the data for the latest run.
-    with open(latestLogFile, "r") as f:
-        logs = []
+            match = PLAYER_ID_PATTERN.search(line)
+            if match is None:
+                continue
+            latestPlayerId = match.group(1)
+            # Only a run's first line says when it started.
+            if latestPlayerId not in runStartTimes:
+                timestring = TIMESTRING_PATTERN.search(line).group(1)
+                runStartTimes[latestPlayerId] = timestring
+    if latestPlayerId is None:
+        return None
+    return latestPlayerId, datetime.fromisoformat(runStartTimes[latestPlayerId])
+
+
+def loadJsonRun(logFile, playerId):
+    """Load the calibration data of a run in a JSON log file.
+
+    :param str logFile: path of the log file
+    :param str playerId: ID of the run
+
+    :return (np.array, list[str]): measurements and directions
+    """
+    # Only the run's lines are parsed.
+    playerIdMarker = f'"playerId": "{playerId}"'
+    measurements = []
+    directions = []
+    with open(logFile, "r") as f:
         for line in f:
+            if playerIdMarker not in line:
+                continue
             log = json.loads(line)
-            if log["playerId"] == latestPlayerId:
-                logs.append(log)
+            if log["gameState"]["isCalibrating"]:
+                measurements.append(log["measurements"])
+                directions.append(log["direction"])
+    return np.array(measurements), directions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Train a decoder on the latest run, and explore it interactively."
+    )
+    parser.add_argument(
+        "--warm-start",
+        action="store_true",
+        help=(
+            "load the latest decoder snapshot with the same features instead of "
+            "training on the logged run (it's only meaningful if it's of a run with "
+            "the same randSeed as the logged run, which the logs don't record)"
+        ),
+    )
+    parser.add_argument(
+        "--save",
+        action="store_true",
+        help="save a snapshot of the trained decoder, to warm-start from next time",
+    )
+    args = parser.parse_args()
+
+    # Get the calibration data of the run that started latest, in either log format.
+    # If the latest binary and JSON runs started at the same time, the binary logs are
+    # used, since they have every sample rather than one every 100ms.
+    latestBinaryRun = None
+    latestBinaryLogDir = getLatestBinaryLogDir()
+    if latestBinaryLogDir is not None:
+        # The index says which run is the latest and which of its rows were
+        # calibrating, so only those rows are read from the memory-mapped log files.
+        runIndexes = readLogIndex(latestBinaryLogDir)
+        if runIndexes:
+            latestRunIndex = list(runIndexes.values())[-1]
+            latestBinaryRun = latestRunIndex, getRunStartTime(latestRunIndex)
+    latestJsonRun = None
+    latestLogFile = getLatestLogFile()
+    if latestLogFile is not None:
+        latestJsonRun = getLatestJsonRun(latestLogFile)
+    if latestBinaryRun is None and latestJsonRun is None:
+        print("No logged runs to analyze.")
+        return
+    if latestJsonRun is None or (
+        latestBinaryRun is not None and latestBinaryRun[1] >= latestJsonRun[1]
+    ):
+        runData = loadRun(latestBinaryRun[0], onlyCalibrating=True)
+        measurements, directions = runData.measurements, runData.directionCodes
+    else:
+        measurements, directions = loadJsonRun(latestLogFile, latestJsonRun[0])
+    if len(measurements) == 0:
+        print("The latest run has no calibration data to train on.")
+        return
+
+    # Turn the measurements into the features Player's decoder works with (with
+    # Player's default settings). The JSON logs only have a measurement every 100ms,
+    # so their window features are over a longer time than Player's.
+    featureExtractor = FeatureExtractor(measurements.shape[1])
+    features = featureExtractor.transformMany(measurements)
+    # What the decoder's inputs are, which a snapshot must have been saved with to be
+    # loaded.
+    featureMetadata = {
+        "numChannels": featureExtractor.numChannels,
+        "features": featureExtractor.features,
+        "featureWindowLength": featureExtractor.windowLength,
+        "emaAlpha": featureExtractor.emaAlpha,
+    }
 
-    # Create and train a decoder on the data from the log file.
-    inputShape = (len(logs[0]["measurements"]),)
+    # Create and train a decoder on the data from the log file, unless warm-starting
+    # it from the latest snapshot it can load.
+    inputShape = features.shape[1:]
     decoder = Decoder(inputShape)
-    for log in logs:
-        if log["gameState"]["isCalibrating"]:
-            decoder.addToTrainingData(log["measurements"], log["direction"])
-    decoder.train()
+    decoder.addManyToTrainingData(features, directions)
+    loadedSnapshot = None
+    if args.warm_start:
+        loadedSnapshot = decoder.loadLatestSnapshot(
+            DECODER_SNAPSHOT_DIR_PATH, expectedMetadata=featureMetadata
+        )
+        if loadedSnapshot is None:
+            print("No decoder snapshot to warm-start from, so training.")
+    if loadedSnapshot is None:
+        decoder.train()
+    else:
+        snapshotPath, snapshotMetadata = loadedSnapshot
+        print(f"Warm-started decoder from {snapshotPath}.")
+    if args.save:
+        os.makedirs(DECODER_SNAPSHOT_DIR_PATH, exist_ok=True)
+        timestring = datetime.now(tz=timezone.utc).strftime("%Y-%m-%dT%H-%M-%S")
+        snapshotPath = os.path.join(DECODER_SNAPSHOT_DIR_PATH, f"{timestring}.npz")
+        decoder.saveSnapshot(
+            snapshotPath, metadata={"source": "analyzer", **featureMetadata}
+        )
+        print(f"Saved decoder snapshot to {snapshotPath}.")
 
     # Put the user into an interactive console, to play with the decoder and data.
     code.interact(local=dict(locals(), **globals()))
@@ -0,0 +1,535 @@
+import os
+import sys
+import json
+import time
+import types
+import uuid
+import fnmatch
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+import functools
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+import sklearn
+
+from constants import HOST, PORT
+from decoder import Decoder
+from player import Player
+from session_log import BinarySessionLog
+from simulation import SimulatedPlayers
+from training_data import DIRECTIONS
+from visualization import SharedRing
+import wire_format
+
+
+# Folder of saved benchmark results, to compare later results against.
+BENCHMARK_DIR_PATH = os.path.join("log", "benchmarks")
+# Latency percentiles to report.
+PERCENTILES = (50, 90, 99, 99.9)
+
+# One thing to benchmark.
+#   name: unique name, with its parameters, e.g. "decode[batch,channels=192]"
+#   makeOp: function that takes a contextlib.ExitStack (to register any cleanup with),
+#       sets up fresh state, and returns the op to time, a function taking the index of
+#       the call
+#   numOps: how many times to call the op when timing it
+#   numMemoryOps: how many times to call the op when measuring its peak memory
+BenchmarkCase = namedtuple(
+    "BenchmarkCase", ["name", "makeOp", "numOps", "numMemoryOps"]
+)
+
+
+def timeOps(op, numOps):
+    """Call an op many times, timing each call.
+
+    :param function op: takes the index of the call
+    :param int numOps:
+
+    :return (np.array, int): duration of each call, and of all of them (nanoseconds)
+    """
+    durations = np.empty(numOps, dtype=np.int64)
+    perfCounter = time.perf_counter_ns
+    startTime = perfCounter()
+    for opIdx in range(numOps):
+        opStartTime = perfCounter()
+        op(opIdx)
+        durations[opIdx] = perfCounter() - opStartTime
+    totalTime = perfCounter() - startTime
+    return durations, totalTime
+
+
+def measurePeakMemory(op, numOps):
+    """Call an op many times, tracking the memory it allocates.
+
+    Done separately from timeOps, since tracking allocations slows them down.
+
+    :param function op: takes the index of the call
+    :param int numOps:
+
+    :return int peakMemory: most bytes allocated by the calls (and not yet freed) at
+        any one time
+    """
+    tracemalloc.start()
+    try:
+        for opIdx in range(numOps):
+            op(opIdx)
+        _, peakMemory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peakMemory
+
+
+def runCase(case):
+    """Time an op and measure its peak memory, each on fresh state.
+
+    :param BenchmarkCase case:
+
+    :return dict results: ops per second, latency percentiles (microseconds, e.g.
+        "p99Us"), and peak memory (bytes)
+    """
+    with contextlib.ExitStack() as exitStack:
+        durations, totalTime = timeOps(case.makeOp(exitStack), case.numOps)
+    with contextlib.ExitStack() as exitStack:
+        peakMemory = measurePeakMemory(case.makeOp(exitStack), case.numMemoryOps)
+    percentiles = np.percentile(durations / 1000, PERCENTILES)
+    results = {
+        "numOps": case.numOps,
+        "opsPerSecond": case.numOps / (totalTime / 1e9),
+        "meanUs": durations.mean() / 1000,
+    }
+    for percent, value in zip(PERCENTILES, percentiles):
+        results[f"p{percent:g}Us"] = value
+    results["peakMemoryBytes"] = peakMemory
+    return results
+
+
+def makePlayingGameState():
+    """A game state (see game/README.md) in which the game isn't calibrating.
+
+    :return dict gameState:
+    """
+    return {
+        "playerCursor": {"x": 100.0, "y": 200.0, "radius": 20},
+        "target": {"x": 500.0, "y": 300.0, "radius": 20},
+        "isCalibrating": False,
+    }
+
+
+# Cases are run in order of their parameters, so only the latest data is cached.
+@functools.lru_cache(maxsize=1)
+def makeTrainingData(numChannels, numSamples, randSeed=0):
+    """Measurements and direction codes of a simulated player (made when first needed,
+    since large ones take a lot of memory).
+
+    :param int numChannels:
+    :param int numSamples:
+    :param int randSeed:
+
+    :return (np.array, np.array): shapes (numSamples, numChannels) and (numSamples,)
+    """
+    players = SimulatedPlayers(
+        1, numChannels=numChannels, randGenerator=np.random.default_rng(randSeed)
+    )
+    codes = players.randomDirectionCodes(numSamples)
+    measurements = players.measure(codes)
+    return measurements[0], codes[0]
+
+
+def makePlayerCases(numChannels, numOps, logDirPath):
+    """Benchmarks of a Player's work per measurement, of logging, and of handing
+    measurements to the visualization process.
+
+    :param int numChannels:
+    :param int numOps: calls of each op
+    :param str logDirPath: folder to write logs to
+
+    :return list[BenchmarkCase]:
+    """
+    gameState = makePlayingGameState()
+
+    def makePlayer(exitStack):
+        player = Player(HOST, PORT, randSeed=0, numChannels=numChannels)
+        exitStack.callback(player.tearDown)
+        player.gameState = gameState
+        return player
+
+    def makeUpdateMeasurementsOp(exitStack):
+        player = makePlayer(exitStack)
+        return lambda _: player.updateMeasurements(gameState)
+
+    def makeJsonLogOp(exitStack):
+        player = makePlayer(exitStack)
+        player.logFile = exitStack.enter_context(
+            open(os.path.join(logDirPath, f"{uuid.uuid4()}.txt"), "w")
+        )
+        player.updateMeasurements(gameState)
+        return lambda _: player.writeLogLine()
+
+    def makeBinaryLogOp(exitStack):
+        sessionLog = BinarySessionLog(logDirPath, str(uuid.uuid4()), numChannels)
+        exitStack.callback(sessionLog.close)
+        measurements = np.random.default_rng(0).random(numChannels)
+        return lambda _: sessionLog.append(
+            measurements, gameState, "right", time.time()
+        )
+
+    def makeVisualizeOp(exitStack):
+        # Charting all the channels, as Visualizer.append does for the charted ones.
+        ring = SharedRing(1000, numChannels)
+        exitStack.callback(ring.close)
+        measurements = np.random.default_rng(0).random(numChannels)
+        channels = np.arange(numChannels)
+        return lambda _: ring.append(measurements, channels)
+
+    return [
+        BenchmarkCase(
+            f"updateMeasurements[channels={numChannels}]",
+            makeUpdateMeasurementsOp,
+            numOps,
+            numOps,
+        ),
+        BenchmarkCase(
+            f"log[json,channels={numChannels}]", makeJsonLogOp, numOps, numOps
+        ),
+        BenchmarkCase(
+            f"log[binary,channels={numChannels}]", makeBinaryLogOp, numOps, numOps
+        ),
+        BenchmarkCase(
+            f"visualize[channels={numChannels}]", makeVisualizeOp, numOps, numOps
+        ),
+    ]
+
+
+def makeDecoderCases(numChannels, numSamples, numOps, numTrainingRepeats, decoderMode):
+    """Benchmarks of a Decoder's training and decoding.
+
+    :param int numChannels:
+    :param int numSamples: training samples
+    :param int numOps: calls of decode
+    :param int numTrainingRepeats: calls of train
+    :param str decoderMode: see Decoder
+
+    :return list[BenchmarkCase]:
+    """
+    params = f"channels={numChannels},samples={numSamples}"
+
+    def makeAddToTrainingDataOp(_):
+        inputs, codes = makeTrainingData(numChannels, numSamples)
+        answers = [DIRECTIONS[code] for code in codes]
+        decoder = Decoder((numChannels,), mode=decoderMode)
+        return lambda idx: decoder.addToTrainingData(inputs[idx], answers[idx])
+
+    def makeDecoderWithData():
+        inputs, codes = makeTrainingData(numChannels, numSamples)
+        decoder = Decoder((numChannels,), mode=decoderMode)
+        decoder.addManyToTrainingData(inputs, codes)
+        return decoder
+
+    def makeTrainOp(_):
+        decoder = makeDecoderWithData()
+
+        def train(_):
+            # Train from scratch each time (which "online" mode otherwise only does
+            # the first time).
+            decoder.model = None
+            decoder.numSamplesTrainedOn = 0
+            decoder.train()
+
+        return train
+
+    # Training can take long with many channels, so the decode op's timing and memory
+    # runs share one trained decoder.
+    @functools.lru_cache(maxsize=1)
+    def makeTrainedDecoder():
+        decoder = makeDecoderWithData()
+        decoder.train()
+        return decoder
+
+    def makeDecodeOp(_):
+        decoder = makeTrainedDecoder()
+        inputs, _ = makeTrainingData(numChannels, numSamples)
+        return lambda idx: decoder.decode(inputs[idx % numSamples])
+
+    return [
+        BenchmarkCase(
+            f"addToTrainingData[{params}]",
+            makeAddToTrainingDataOp,
+            numSamples,
+            numSamples,
+        ),
+        BenchmarkCase(
+            f"train[{decoderMode},{params}]", makeTrainOp, numTrainingRepeats, 1
+        ),
+        BenchmarkCase(
+            f"decode[{decoderMode},{params}]", makeDecodeOp, numOps, min(numOps, 1000)
+        ),
+    ]
+
+
+def makeMessageCases(numOps):
+    """Benchmarks of parsing GAME_UPDATE messages and making GAME_COMMAND messages, in
+    both the JSON and binary formats.
+
+    :param int numOps: calls of each op
+
+    :return list[BenchmarkCase]:
+    """
+    gameState = makePlayingGameState()
+    jsonGameUpdate = json.dumps(
+        {
+            "TYPE": "GAME_UPDATE",
+            "PAYLOAD": {
+                "gameState": gameState,
+                "timestring": datetime.now(tz=timezone.utc).isoformat(),
+            },
+        }
+    )
+    binaryGameUpdate = wire_format.encodeGameUpdate(gameState, time.time() * 1000)
+    gameCommand = {"move": {"x": 1, "y": 0}}
+    # Stand-ins for connections, which are only asked for their subprotocol.
+    jsonWebSocket = types.SimpleNamespace(subprotocol=wire_format.JSON_SUBPROTOCOL)
+    binaryWebSocket = types.SimpleNamespace(subprotocol=wire_format.BINARY_SUBPROTOCOL)
+
+    cases = []
+    for formatName, gameUpdate, websocket in (
+        ("json", jsonGameUpdate, jsonWebSocket),
+        ("binary", binaryGameUpdate, binaryWebSocket),
+    ):
+        cases += [
+            BenchmarkCase(
+                f"decodeGameUpdate[{formatName}]",
+                lambda _, gameUpdate=gameUpdate: (
+                    lambda _: wire_format.decodeMessage(gameUpdate)
+                ),
+                numOps,
+                min(numOps, 1000),
+            ),
+            BenchmarkCase(
+                f"makeGameCommandMsg[{formatName}]",
+                lambda _, websocket=websocket: (
+                    lambda _: Player.makeGameCommandMsg(gameCommand, websocket)
+                ),
+                numOps,
+                min(numOps, 1000),
+            ),
+        ]
+    return cases
+
+
+def makeStartupCases(numOps):
+    """Benchmarks of starting a fresh Python process that imports each entry point, or
+    makes a Player (in which the import time of heavy dependencies shows up).
+
+    Peak memory isn't measured, since it's in the other process.
+
+    :param int numOps: processes to start for each
+
+    :return list[BenchmarkCase]:
+    """
+    scripts = {
+        f"import {moduleName}": f"import {moduleName}"
+        for moduleName in ("player", "server", "inspector", "headless_game")
+    }
+    scripts["Player()"] = "from player import Player; Player('localhost', 0)"
+    playerDirPath = os.path.dirname(os.path.abspath(__file__))
+
+    def makeStartupOp(script):
+        return lambda _: subprocess.run(
+            [sys.executable, "-c", script], cwd=playerDirPath, check=True
+        )
+
+    return [
+        BenchmarkCase(
+            f"startup[{name}]",
+            lambda _, script=script: makeStartupOp(script),
+            numOps,
+            0,
+        )
+        for name, script in scripts.items()
+    ]
+
+
+def getEnvironment():
+    """What the benchmarks ran on, to save with the results.
+
+    :return dict environment:
+    """
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpuCount": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def compareResults(results, baselineResults, tolerance):
+    """Compare results with a baseline's.
+
+    :param dict results: by case name, as from runCase
+    :param dict baselineResults: the same, from an earlier run
+    :param float tolerance: fraction by which ops per second may drop, or peak memory
+        may grow, before it counts as a regression
+
+    :return dict comparison: by case name (of cases in both), the ratios of ops per
+        second, p99 latency, and peak memory to the baseline's, and whether it
+        regressed
+    """
+    comparison = {}
+    for name, caseResults in results.items():
+        if name not in baselineResults:
+            continue
+        baseline = baselineResults[name]
+        opsPerSecondRatio = caseResults["opsPerSecond"] / baseline["opsPerSecond"]
+        p99Ratio = caseResults["p99Us"] / baseline["p99Us"]
+        # Tiny allocations (e.g. a few small objects) are noise, so don't compare
+        # below a KiB.
+        peakMemoryRatio = max(caseResults["peakMemoryBytes"], 1024) / max(
+            baseline["peakMemoryBytes"], 1024
+        )
+        comparison[name] = {
+            "opsPerSecondRatio": opsPerSecondRatio,
+            "p99Ratio": p99Ratio,
+            "peakMemoryRatio": peakMemoryRatio,
+            "isRegression": (
+                opsPerSecondRatio < 1 - tolerance or peakMemoryRatio > 1 + tolerance
+            ),
+        }
+    return comparison
+
+
+def printResults(results, comparison=None):
+    """Print a table of results, with one row per case.
+
+    :param dict results: by case name, as from runCase
+    :param dict|None comparison: from compareResults, to add columns for
+    """
+    nameWidth = max(len(name) for name in results) + 2
+    header = f"{'':<{nameWidth}}{'ops/s':>12}{'p50 us':>10}{'p99 us':>10}"
+    header += f"{'p99.9 us':>10}{'peak KiB':>10}"
+    if comparison is not None:
+        header += f"{'ops/s':>9}{'p99':>9}{'peak':>9}"
+    print(header)
+    for name, caseResults in results.items():
+        row = f"{name:<{nameWidth}}{caseResults['opsPerSecond']:>12.5g}"
+        row += f"{caseResults['p50Us']:>10.4g}{caseResults['p99Us']:>10.4g}"
+        row += f"{caseResults['p99.9Us']:>10.4g}"
+        row += f"{caseResults['peakMemoryBytes'] / 1024:>10.5g}"
+        if comparison is not None and name in comparison:
+            caseComparison = comparison[name]
+            # Ratios to the baseline.
+            row += f"{caseComparison['opsPerSecondRatio']:>8.2f}x"
+            row += f"{caseComparison['p99Ratio']:>8.2f}x"
+            row += f"{caseComparison['peakMemoryRatio']:>8.2f}x"
+            if caseComparison["isRegression"]:
+                row += "  REGRESSION"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the player's hot paths, and compare with a baseline."
+    )
+    parser.add_argument("--channels", type=int, nargs="+", default=[192, 1024])
+    parser.add_argument(
+        "--training-samples",
+        type=int,
+        nargs="+",
+        default=[1000, 10000],
+        help="training data sizes for addToTrainingData, train, and decode",
+    )
+    parser.add_argument("--ops", type=int, default=10000, help="calls of fast ops")
+    parser.add_argument("--training-repeats", type=int, default=3)
+    parser.add_argument(
+        "--startup-repeats", type=int, default=5, help="processes to start per case"
+    )
+    parser.add_argument(
+        "--decoder-mode",
+        nargs="+",
+        default=["batch"],
+        choices=["batch", "online", "kalman"],
+    )
+    parser.add_argument(
+        "--cases",
+        nargs="+",
+        default=["*"],
+        help="only run cases whose names match one of these patterns, e.g. 'decode*'",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help=f"results file (default: a new file in {BENCHMARK_DIR_PATH})",
+    )
+    parser.add_argument("--baseline", default=None, help="results file to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="fraction ops/s may drop (or peak memory grow) before it is a regression",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as logDirPath:
+        cases = makeStartupCases(args.startup_repeats)
+        cases += makeMessageCases(args.ops)
+        for numChannels in args.channels:
+            cases += makePlayerCases(numChannels, args.ops, logDirPath)
+            for numSamples in args.training_samples:
+                for decoderMode in args.decoder_mode:
+                    cases += makeDecoderCases(
+                        numChannels,
+                        numSamples,
+                        args.ops,
+                        args.training_repeats,
+                        decoderMode,
+                    )
+        # The same addToTrainingData case is made for each decoder mode.
+        cases = list({case.name: case for case in cases}.values())
+        cases = [
+            case
+            for case in cases
+            if any(fnmatch.fnmatchcase(case.name, pattern) for pattern in args.cases)
+        ]
+
+        results = {}
+        for case in cases:
+            print(f"Running {case.name}...", flush=True)
+            results[case.name] = runCase(case)
+
+    timestring = datetime.now(tz=timezone.utc).strftime("%Y-%m-%dT%H-%M-%S")
+    outputPath = args.output or os.path.join(BENCHMARK_DIR_PATH, f"{timestring}.json")
+    os.makedirs(os.path.dirname(outputPath) or ".", exist_ok=True)
+    with open(outputPath, "w") as f:
+        json.dump(
+            {
+                "timestring": datetime.now(tz=timezone.utc).isoformat(),
+                "environment": getEnvironment(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Saved results to {outputPath}.\n")
+
+    comparison = None
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baselineResults = json.load(f)["results"]
+        comparison = compareResults(results, baselineResults, args.tolerance)
+        print(f"Compared with {args.baseline} (ratios of this run to it):")
+    printResults(results, comparison)
+    if comparison is not None and any(
+        caseComparison["isRegression"] for caseComparison in comparison.values()
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import warnings
+
+import numpy as np
+
+
+# Ways of scoring how useful each input is for telling the directions apart.
+#   anova: ANOVA F-statistic of the input across the directions (how much more its
+#       mean differs between directions than it varies within a direction)
+#   variance: the input's variance (doesn't look at the directions, so it favors any
+#       input that varies a lot, informative or not)
+SELECTION_METHODS = ("anova", "variance")
+
+
+def scoreInputs(inputs, codes, method="anova"):
+    """Score how useful each input is for telling the directions apart.
+
+    :param np.array inputs: shape (numSamples, numInputs)
+    :param np.array codes: shape (numSamples,), integer direction codes
+    :param str method: one of SELECTION_METHODS
+
+    :return np.array scores: shape (numInputs,), higher is more useful
+    """
+    if method == "anova":
+        from sklearn import feature_selection
+
+        with warnings.catch_warnings():
+            # Inputs that are constant within every direction get a score of nan.
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            scores, _ = feature_selection.f_classif(inputs, codes)
+        return np.nan_to_num(scores, nan=0.0)
+    if method == "variance":
+        return inputs.var(axis=0)
+    raise ValueError(f"Unknown selection method: {method}")
+
+
+def selectInputs(inputs, codes, numSelected, method="anova"):
+    """Pick the most useful inputs for telling the directions apart.
+
+    :param np.array inputs: shape (numSamples, numInputs)
+    :param np.array codes: shape (numSamples,), integer direction codes
+    :param int numSelected: how many inputs to pick
+    :param str method: one of SELECTION_METHODS
+
+    :return np.array selectedInputs: indices of the picked inputs, in increasing order
+    """
+    scores = scoreInputs(inputs, codes, method)
+    numSelected = min(numSelected, len(scores))
+    best = np.argpartition(scores, len(scores) - numSelected)[-numSelected:]
+    return np.sort(best)
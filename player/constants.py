@@ -0,0 +1,12 @@
+import os
+from datetime import datetime
+
+
+# Where the Player's WebSocket server listens (see server.py for hosting many).
+HOST = "localhost"
+PORT = 1530
+LOG_FILE_PATH = os.path.join("log", f"{datetime.today().strftime('%Y-%m-%d')}.txt")
+# Folder in which each run logged with the "binary" logging backend gets its folder.
+BINARY_LOG_DIR_PATH = os.path.join("log", datetime.today().strftime("%Y-%m-%d"))
+# Folder of saved decoder snapshots (see Decoder.saveSnapshot), to warm-start from.
+DECODER_SNAPSHOT_DIR_PATH = os.path.join("log", "decoders")
@@ -1,33 +1,221 @@
+import os
+import copy
+import json
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+
 import numpy as np
-from sklearn import svm
+
+from channel_selection import SELECTION_METHODS, selectInputs
+from kalman import expandKalmanModel, fitKalmanModel, filterMany, makeKalmanModel
+from training_data import DIRECTIONS, TrainingData
+
+
+# How to move the cursor to go in each direction.
+MOVEMENTS = {
+    "up": {"x": 0, "y": 1},
+    "right": {"x": 1, "y": 0},
+    "down": {"x": 0, "y": -1},
+    "left": {"x": -1, "y": 0},
+}
+# The same movements as (x, y) velocities, by direction code (see
+# training_data.DIRECTION_CODES).
+DIRECTION_VELOCITIES = np.array(
+    [
+        (MOVEMENTS[direction]["x"], MOVEMENTS[direction]["y"])
+        for direction in DIRECTIONS
+    ],
+    dtype=np.float64,
+)
+# Parameters of a "kalman" mode model (see kalman.KalmanModel) stored in snapshots.
+KALMAN_SNAPSHOT_FIELDS = (
+    "stateTransition",
+    "processNoise",
+    "observationMatrix",
+    "observationOffset",
+    "observationNoise",
+)
+
+# Version of the format of the files written by Decoder.saveSnapshot.
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_FILE_EXTENSION = ".npz"
+
+# A trained model, published as a whole so decoding never sees a half-updated one.
+#   svmModel: fitted sklearn classifier
+#   scaler: fitted StandardScaler to apply to inputs first, or None
+#   weights: contiguous (numClasses, numInputs) array, the linear model's coefficients
+#       with the scaler folded in, so that scores = weights @ inp + intercepts
+#   intercepts: (numClasses,) array
+#   gameCommands: tuple of the game command for each row of weights
+#   scores: (numClasses,) scratch array that decode() writes scores into
+#   selectedInputs: if svmModel (and scaler) only take some of the inputs, their
+#       indices (weights has zeros for the others), or None
+TrainedModel = namedtuple(
+    "TrainedModel",
+    [
+        "svmModel",
+        "scaler",
+        "weights",
+        "intercepts",
+        "gameCommands",
+        "scores",
+        "selectedInputs",
+    ],
+)
+
+
+def makeTrainedModel(svmModel, scaler=None, selectedInputs=None, numInputs=None):
+    """Cache what is needed to decode quickly with a fitted linear classifier.
+
+    :param svmModel: fitted sklearn linear classifier (has coef_, intercept_, classes_)
+    :param sklearn.preprocessing.StandardScaler|None scaler: fitted scaler applied to
+        inputs before svmModel, if any
+    :param np.array|None selectedInputs: if svmModel was fit on only some of the
+        inputs, their indices
+    :param int|None numInputs: how many inputs there are in all (if selectedInputs)
+
+    :return TrainedModel:
+    """
+    weights = svmModel.coef_
+    intercepts = svmModel.intercept_
+    classes = svmModel.classes_
+    # Fold the standardization into the weights: w.((x - mean) / scale) + b is the same
+    # as (w / scale).x + (b - w.(mean / scale)).
+    if scaler is not None:
+        intercepts = intercepts - weights @ (scaler.mean_ / scaler.scale_)
+        weights = weights / scaler.scale_
+    # With only 2 classes, sklearn gives a single row, whose score is positive for the
+    # second class. Make that into one row per class so argmax works the same way.
+    if len(classes) == 2:
+        weights = np.vstack((-weights, weights))
+        intercepts = np.concatenate((-intercepts, intercepts))
+    # Give the inputs that weren't selected weights of zero. Decoding then takes all
+    # the inputs, since one dot product over all of them is faster than gathering the
+    # selected ones first.
+    if selectedInputs is not None:
+        selectedWeights = weights
+        weights = np.zeros((len(weights), numInputs))
+        weights[:, selectedInputs] = selectedWeights
+    gameCommands = tuple({"move": MOVEMENTS[DIRECTIONS[code]]} for code in classes)
+    return TrainedModel(
+        svmModel=svmModel,
+        scaler=scaler,
+        weights=np.ascontiguousarray(weights, dtype=np.float64),
+        intercepts=np.ascontiguousarray(intercepts, dtype=np.float64),
+        gameCommands=gameCommands,
+        scores=np.empty(len(classes)),
+        selectedInputs=selectedInputs,
+    )
+
+
+def getDecoderSnapshots(snapshotDirPath):
+    """Get the decoder snapshots saved in a folder, latest first.
+
+    :param str snapshotDirPath:
+
+    :return list[str] snapshotPaths:
+    """
+    if not os.path.isdir(snapshotDirPath):
+        return []
+    # Snapshot files are named starting with the UTC time they were saved (see
+    # Player.saveDecoderSnapshot), so later ones are greater strings.
+    snapshotFileNames = [
+        f for f in os.listdir(snapshotDirPath) if f.endswith(SNAPSHOT_FILE_EXTENSION)
+    ]
+    return [
+        os.path.join(snapshotDirPath, f)
+        for f in sorted(snapshotFileNames, reverse=True)
+    ]
 
 
 class Decoder:
-    """Decoder of the player's measurements into game commands."""
+    """Decoder of the player's measurements into game commands.
 
-    def __init__(self, inputShape):
+    Training may happen in a different thread than adding training data and decoding.
+    Training works on a snapshot of the training data and then swaps in the newly
+    trained model, so decoding can keep using the previous model in the meantime.
+    """
+
+    def __init__(
+        self,
+        inputShape,
+        mode="batch",
+        maxTrainingSamples=None,
+        evictionPolicy="window",
+        maxSamplesPerUpdate=1000,
+        selectionMethod=None,
+        numSelectedInputs=16,
+    ):
         """
         :param tuple[float] inputShape: shape of each sample (e.g. (192,) if each sample
             is a 1-D array of length 192)
+        :param str mode: "batch" to refit the model from scratch on all the training
+            data each time we train, "online" to update the model using only the
+            training data added since the last time we trained, or "kalman" to refit a
+            Kalman filter of the cursor's velocity from scratch each time we train, and
+            decode into continuous moves that are smoothed over time
+        :param int|None maxTrainingSamples: most training samples to keep, or None to
+            keep all of them
+        :param str evictionPolicy: how to make room once maxTrainingSamples is reached
+            ("window" or "reservoir", see TrainingData)
+        :param int maxSamplesPerUpdate: in "online" mode, most new samples to learn
+            from per call to train(), to bound how long each call takes (any remaining
+            new samples are learned from in later calls)
+        :param str|None selectionMethod: to fit the model on only the most useful
+            inputs, how to pick them (see channel_selection.SELECTION_METHODS), or None
+            to use all the inputs. In "batch" and "kalman" modes they are picked anew
+            each time we train, in "online" mode only the first time
+        :param int numSelectedInputs: how many inputs to pick, if selectionMethod
         """
+        if mode not in ("batch", "online", "kalman"):
+            raise ValueError(f"Unknown decoder mode: {mode}")
+        if selectionMethod is not None and selectionMethod not in SELECTION_METHODS:
+            raise ValueError(f"Unknown selection method: {selectionMethod}")
+
         self.inputShape = inputShape
+        self.mode = mode
+        self.maxSamplesPerUpdate = maxSamplesPerUpdate
+        self.selectionMethod = selectionMethod
+        self.numSelectedInputs = numSelectedInputs
+        # How many values each input has in all.
+        self.numInputs = int(np.prod(self.inputShape))
 
-        # With the following shape, self.trainingInputs is an array of 0 elements, each
-        # of shape inputShape. E.g. np.empty((0, 192)) can have a 1-D array of length
-        # 192 appended to it, so it becomes shape (1, 192), then another makes it
-        # (2, 192), etc.
-        self.trainingInputs = np.empty((0, *self.inputShape))
-        # 1-D array of correct classifications of the training inputs ("up", "right",
-        # "down", or "left").
-        self.trainingAnswers = np.array([])
-
-        # Object that handles the training and predicting using an SVM.
-        self.svmModel = svm.LinearSVC()
+        # Growable store of the training inputs and their correct classifications
+        # ("up", "right", "down", or "left", stored as integer codes).
+        self.trainingData = TrainingData(
+            self.inputShape, maxSize=maxTrainingSamples, evictionPolicy=evictionPolicy
+        )
+
+        # Guards the training data (and the flags about it) against being added to
+        # while a training thread is taking a snapshot of it.
+        self.trainingDataLock = threading.Lock()
+
+        # Latest trained model (a TrainedModel, or a kalman.KalmanModel in "kalman"
+        # mode), or None before the first training.
+        self.model = None
+        # In "kalman" mode, the filter's current estimate of the cursor's (x, y)
+        # velocity, and scratch space to compute the next one in.
+        self.kalmanState = np.zeros(2)
+        self._kalmanScratch = np.empty(2)
+        # How many samples had been added to the training data as of the last time we
+        # trained ("online" mode learns from the samples added after that).
+        self.numSamplesTrainedOn = 0
         # Whether there is any new data since our model was last trained.
         self.isNewDataSinceLastTrained = False
         # Whether the model has been trained even once.
         self.hasBeenTrainedAtAll = False
 
+    @property
+    def trainingInputs(self):
+        """View of the stored training inputs, shape (numSamples, *inputShape)."""
+        return self.trainingData.inputs
+
+    @property
+    def trainingAnswers(self):
+        """The correct classifications of the training inputs ("up", "right", etc.)."""
+        return self.trainingData.answers
+
     def addToTrainingData(self, inp, ans):
         """Given an input, and the correct output, add to the stored training data.
 
@@ -35,45 +223,413 @@ class Decoder:
         :param string ans: the correct classification of the given sample ("up",
             "right", "down", or "left")
         """
-        self.trainingInputs = np.vstack((self.trainingInputs, inp))
-        self.trainingAnswers = np.append(self.trainingAnswers, ans)
-        self.isNewDataSinceLastTrained = True
+        with self.trainingDataLock:
+            self.trainingData.add(inp, ans)
+            self.isNewDataSinceLastTrained = True
+
+    def addManyToTrainingData(self, inps, answers):
+        """Like addToTrainingData, but for many samples at once.
+
+        :param np.array inps: np array of shape (numSamples, *self.inputShape)
+        :param list[str]|np.array answers: the correct classification of each sample
+            (as strings, or as integer codes, see training_data.DIRECTION_CODES)
+        """
+        if len(inps) == 0:
+            return
+        with self.trainingDataLock:
+            self.trainingData.extend(inps, answers)
+            self.isNewDataSinceLastTrained = True
+
+    @property
+    def selectedInputs(self):
+        """Indices of the inputs the latest model was fit on, or None if it uses all
+        of them (or there is no model yet).
+        """
+        if self.model is None:
+            return None
+        if self.mode == "kalman":
+            return self.model.observationIndices
+        return self.model.selectedInputs
+
+    def _selectInputs(self, inps, codes):
+        """Pick the inputs to fit the model on, if selecting inputs.
+
+        :return np.array|None selectedInputs:
+        """
+        if self.selectionMethod is None:
+            return None
+        return selectInputs(inps, codes, self.numSelectedInputs, self.selectionMethod)
+
+    @property
+    def svmModel(self):
+        """The latest trained sklearn classifier, or None before the first training."""
+        return getattr(self.model, "svmModel", None)
 
     def train(self):
         """Given the current built-up training data, fit our model to that data so it is
         prepared to start decoding measurements into game commands.
+
+        Safe to call from a thread other than the one adding training data and
+        decoding, as long as only one call to train() runs at a time.
         """
         try:
-            self.svmModel.fit(self.trainingInputs, self.trainingAnswers)
+            if self.mode == "online":
+                model, numSamplesTrainedOn = self._trainOnline()
+            elif self.mode == "kalman":
+                model, numSamplesTrainedOn = self._trainKalman()
+            else:
+                model, numSamplesTrainedOn = self._trainBatch()
         except ValueError as e:
             print(f"Error while fitting model: {e}")
+            return
+
+        with self.trainingDataLock:
+            # Publish the new model with a single assignment, so decode() sees either
+            # the old model or the new one, never a mix.
+            if model is not None:
+                self.model = model
+                self.hasBeenTrainedAtAll = True
+            self.numSamplesTrainedOn = numSamplesTrainedOn
+            self.isNewDataSinceLastTrained = (
+                self.numSamplesTrainedOn < self.trainingData.numAdded
+            )
+
+    def _trainBatch(self):
+        """Fit a new model from scratch on all the stored training data.
+
+        :return (TrainedModel, int): the new model, and how many samples had been added
+            to the training data as of the snapshot it was trained on
+        """
+        with self.trainingDataLock:
+            inps = self.trainingData.inputs.copy()
+            codes = self.trainingData.codes.copy()
+            numAdded = self.trainingData.numAdded
+        selectedInputs = self._selectInputs(inps, codes)
+        if selectedInputs is not None:
+            inps = inps[:, selectedInputs]
+        # sklearn is imported only once there's something to fit, since importing it
+        # takes most of a second (decoding a trained model only needs numpy).
+        from sklearn import svm
+
+        svmModel = svm.LinearSVC()
+        svmModel.fit(inps, codes)
+        model = makeTrainedModel(svmModel, None, selectedInputs, self.numInputs)
+        return model, numAdded
+
+    def _trainOnline(self):
+        """Update a copy of the current model with (up to maxSamplesPerUpdate of) the
+        training samples added since we last trained.
+
+        The model is a linear SVM trained by stochastic gradient descent, which can be
+        updated a batch of samples at a time. Its inputs are standardized by an
+        incrementally updated scaler, since SGD does poorly on unscaled inputs. If
+        selecting inputs, there is no model until every direction is in the training
+        data. Then the inputs are picked from all of it, and kept from then on.
+
+        :return (TrainedModel|None, int): the updated model (or None if there were no
+            new samples), and how many samples had been added to the training data as
+            of the last sample it was trained on
+        """
+        selectedInputs = None if self.model is None else self.model.selectedInputs
+        if self.model is None and self.selectionMethod is not None:
+            # The picked inputs are kept, so wait until they can be picked for every
+            # direction (the first samples may be of only some of them).
+            with self.trainingDataLock:
+                numSamplesPerCode = np.bincount(
+                    self.trainingData.codes, minlength=len(DIRECTIONS)
+                )
+                if numSamplesPerCode.min() == 0:
+                    return None, self.numSamplesTrainedOn
+                allInps = self.trainingData.inputs.copy()
+                allCodes = self.trainingData.codes.copy()
+            selectedInputs = self._selectInputs(allInps, allCodes)
+        with self.trainingDataLock:
+            inps, codes, numSamplesTrainedOn = self.trainingData.samplesSince(
+                self.numSamplesTrainedOn, limit=self.maxSamplesPerUpdate
+            )
+            # Only copy the inputs the model takes.
+            if selectedInputs is None:
+                inps = inps.copy()
+            else:
+                inps = inps[:, selectedInputs]
+            codes = codes.copy()
+        if len(inps) == 0:
+            return None, numSamplesTrainedOn
+
+        if self.model is None:
+            from sklearn import linear_model, preprocessing
+
+            svmModel = linear_model.SGDClassifier(loss="hinge", alpha=0.01)
+            scaler = preprocessing.StandardScaler()
         else:
-            self.isNewDataSinceLastTrained = False
-            self.hasBeenTrainedAtAll = True
+            # Update copies, since the current model may be in use for decoding.
+            svmModel = copy.deepcopy(self.model.svmModel)
+            scaler = copy.deepcopy(self.model.scaler)
+        scaler.partial_fit(inps)
+        svmModel.partial_fit(
+            scaler.transform(inps), codes, classes=np.arange(len(DIRECTIONS))
+        )
+        return (
+            makeTrainedModel(svmModel, scaler, selectedInputs, self.numInputs),
+            numSamplesTrainedOn,
+        )
+
+    def _trainKalman(self):
+        """Fit a new Kalman filter from scratch on all the stored training data, taking
+        the velocity of each sample's direction (see DIRECTION_VELOCITIES) as the
+        state, and the measurements as the observations.
+
+        The filter's model of how the velocity changes over time is fit from pairs of
+        samples in the order they were added, so it assumes the training data is a time
+        series (if samples have been evicted, some pairs aren't consecutive).
+
+        :return (kalman.KalmanModel, int): the new model, and how many samples had
+            been added to the training data as of the snapshot it was trained on
+        """
+        with self.trainingDataLock:
+            inps, codes, numAdded = self.trainingData.samplesSince(0)
+            inps, codes = inps.astype(np.float64), codes.copy()
+        selectedInputs = self._selectInputs(inps, codes)
+        if selectedInputs is None:
+            return fitKalmanModel(DIRECTION_VELOCITIES[codes], inps), numAdded
+        model = fitKalmanModel(DIRECTION_VELOCITIES[codes], inps[:, selectedInputs])
+        return expandKalmanModel(model, selectedInputs, self.numInputs), numAdded
 
     def decode(self, measurements):
         """Given measurements of the player, predict what that player is trying to do in
         the game and thus output a game command.
 
+        This is called every tick, so it avoids sklearn's predict() (and its input
+        validation) and any allocation, and uses the model's cached weights instead.
+
         :param np.array measurements: same structure as Player.measurements
 
         :return dict gameCommand: see WebSocket API of the game for how to structure
-            commands (except without "timestring")
+            commands (except without "timestring"). The same dict objects are returned
+            over and over, so don't modify them.
         """
-        if not self.hasBeenTrainedAtAll:
+        model = self.model
+        if model is None:
             return None
+        if self.mode == "kalman":
+            return self._decodeKalman(model, measurements)
+
+        scores = model.scores
+        np.dot(model.weights, measurements, out=scores)
+        scores += model.intercepts
+        return model.gameCommands[scores.argmax()]
+
+    def _decodeKalman(self, model, measurements):
+        """Take one step of the Kalman filter, and move the way it estimates the cursor
+        is going.
+
+        :param kalman.KalmanModel model:
+        :param np.array measurements:
+
+        :return dict gameCommand: with a continuous "move" (a new dict each time)
+        """
+        state = self._kalmanScratch
+        np.dot(model.gain, measurements, out=state)
+        state += model.gainOffset
+        state += model.steadyStateTransition @ self.kalmanState
+        self._kalmanScratch, self.kalmanState = self.kalmanState, state
+        return {"move": {"x": float(state[0]), "y": float(state[1])}}
+
+    def decodeMany(self, measurementsMatrix):
+        """Like decode, but for many samples at once (e.g. to replay a logged run).
+
+        :param np.array measurementsMatrix: shape (numSamples, *self.inputShape)
+
+        :return list[dict] gameCommands: one per sample (or None if the model hasn't
+            been trained yet)
+        """
+        model = self.model
+        if model is None:
+            return None
+
+        if self.mode == "kalman":
+            # Filter the samples as a time series, starting from standing still.
+            velocities = filterMany(model, measurementsMatrix)
+            return [{"move": {"x": x, "y": y}} for x, y in velocities.tolist()]
+
+        scores = measurementsMatrix @ model.weights.T
+        scores += model.intercepts
+        return [model.gameCommands[idx] for idx in scores.argmax(axis=1)]
+
+    def saveSnapshot(self, path, metadata=None):
+        """Save the trained model, so a later run can warm-start from it (see
+        loadSnapshot).
+
+        The snapshot is a compressed .npz file (no pickles) holding the model's
+        parameters, the directions its classes are, a summary of the training data it
+        was trained on, and JSON metadata (how it was trained, plus anything passed in).
 
-        inp = np.array([measurements])
-        (ans,) = self.svmModel.predict(inp)
+        :param str path: file to write (".npz" is added if it doesn't end with it)
+        :param dict|None metadata: extra JSON-serializable info to save with it
 
-        movement = {
-            "up": {"x": 0, "y": 1},
-            "right": {"x": 1, "y": 0},
-            "down": {"x": 0, "y": -1},
-            "left": {"x": -1, "y": 0},
-        }[ans]
+        :return dict metadata: everything that was saved as metadata
+        """
+        model = self.model
+        if model is None:
+            raise ValueError(
+                "Decoder has not been trained, so there is nothing to save."
+            )
+
+        with self.trainingDataLock:
+            inputs = self.trainingData.inputs
+            codes = self.trainingData.codes
+            classCounts = np.bincount(codes, minlength=len(DIRECTIONS))
+            inputMeans = inputs.mean(axis=0) if len(inputs) else None
+            inputStdDevs = inputs.std(axis=0) if len(inputs) else None
+            numSamplesTrainedOn = self.numSamplesTrainedOn
 
-        gameCommand = {
-            "move": movement,
+        metadata = {
+            **(metadata or {}),
+            "formatVersion": SNAPSHOT_FORMAT_VERSION,
+            "timestring": datetime.now(tz=timezone.utc).isoformat(),
+            "mode": self.mode,
+            "inputShape": list(self.inputShape),
+            "numSamplesTrainedOn": numSamplesTrainedOn,
+            "selectionMethod": self.selectionMethod,
+        }
+        arrays = {
+            # Which direction (see training_data.DIRECTIONS) each class code is.
+            "directions": np.array(DIRECTIONS),
+            # Summary of the training data.
+            "classCounts": classCounts,
         }
-        return gameCommand
+        if inputMeans is not None:
+            arrays["inputMeans"] = inputMeans
+            arrays["inputStdDevs"] = inputStdDevs
+        # Which inputs the model takes, if it was fit on only some of them.
+        if self.selectedInputs is not None:
+            arrays["selectedInputs"] = self.selectedInputs
+
+        if self.mode == "kalman":
+            # The fitted parameters (the gain is recomputed from them on loading).
+            metadata["modelClass"] = "KalmanModel"
+            for field in KALMAN_SNAPSHOT_FIELDS:
+                arrays[field] = getattr(model, field)
+        else:
+            svmModel = model.svmModel
+            metadata["modelClass"] = type(svmModel).__name__
+            metadata["modelParams"] = svmModel.get_params()
+            # The linear model, before folding in the scaler.
+            arrays["coef"] = svmModel.coef_
+            arrays["intercept"] = svmModel.intercept_
+            arrays["classes"] = svmModel.classes_
+            # How many samples SGD has taken steps on, which sets its learning rate.
+            if hasattr(svmModel, "t_"):
+                arrays["numUpdates"] = np.array(svmModel.t_)
+            if model.scaler is not None:
+                arrays["scalerMean"] = model.scaler.mean_
+                arrays["scalerVar"] = model.scaler.var_
+                arrays["scalerScale"] = model.scaler.scale_
+                arrays["scalerNumSamplesSeen"] = np.array(model.scaler.n_samples_seen_)
+
+        arrays["metadata"] = np.array(json.dumps(metadata))
+        np.savez_compressed(path, **arrays)
+        return metadata
+
+    def loadLatestSnapshot(self, snapshotDirPath, expectedMetadata=None):
+        """Load the latest snapshot in a folder that this decoder can load, skipping
+        (and saying why) later ones of a different mode or metadata (see loadSnapshot).
+
+        :param str snapshotDirPath:
+        :param dict|None expectedMetadata: see loadSnapshot
+
+        :return (str, dict)|None: path of the snapshot loaded and its metadata, or None
+            if there is none to load
+        """
+        for snapshotPath in getDecoderSnapshots(snapshotDirPath):
+            try:
+                metadata = self.loadSnapshot(snapshotPath, expectedMetadata)
+            except ValueError as e:
+                print(f"Skipping decoder snapshot {snapshotPath}: {e}")
+                continue
+            return snapshotPath, metadata
+        return None
+
+    def loadSnapshot(self, path, expectedMetadata=None):
+        """Start from a model saved by saveSnapshot, so decoding can start right away.
+
+        The snapshot must be of a decoder in the same mode. In "online" mode, later
+        training refines the loaded model with the new training data. In "batch" and
+        "kalman" modes, the loaded model is used until the first training, which fits a
+        new model on the new training data.
+
+        :param str path: file written by saveSnapshot
+        :param dict|None expectedMetadata: metadata the snapshot must have been saved
+            with (e.g. what its inputs are the features of), since a model of different
+            inputs of the same shape would load fine but decode nonsense
+
+        :return dict metadata: saved with the snapshot
+        """
+        with np.load(path) as snapshot:
+            metadata = json.loads(snapshot["metadata"].item())
+            if metadata["formatVersion"] != SNAPSHOT_FORMAT_VERSION:
+                raise ValueError(
+                    f"Unsupported snapshot format version: {metadata['formatVersion']}"
+                )
+            if tuple(metadata["inputShape"]) != tuple(self.inputShape):
+                raise ValueError(
+                    f"Snapshot has input shape {tuple(metadata['inputShape'])}, but "
+                    f"this decoder has input shape {tuple(self.inputShape)}"
+                )
+            for key, expectedValue in (expectedMetadata or {}).items():
+                # Compared as saved in the JSON (e.g. tuples as lists).
+                expectedValue = json.loads(json.dumps(expectedValue))
+                if metadata.get(key) != expectedValue:
+                    raise ValueError(
+                        f"Snapshot has {key} {metadata.get(key)!r}, but this decoder "
+                        f"needs {key} {expectedValue!r}"
+                    )
+            if metadata["mode"] != self.mode:
+                raise ValueError(
+                    f"Snapshot has mode {metadata['mode']!r}, but this decoder has mode "
+                    f"{self.mode!r}"
+                )
+            if tuple(snapshot["directions"]) != DIRECTIONS:
+                raise ValueError("Snapshot has different directions than this decoder")
+            selectedInputs = (
+                snapshot["selectedInputs"] if "selectedInputs" in snapshot else None
+            )
+
+            if self.mode == "kalman":
+                model = makeKalmanModel(
+                    *(snapshot[field] for field in KALMAN_SNAPSHOT_FIELDS)
+                )
+                if selectedInputs is not None:
+                    model = expandKalmanModel(model, selectedInputs, self.numInputs)
+                with self.trainingDataLock:
+                    self.model = model
+                    self.hasBeenTrainedAtAll = True
+                return metadata
+
+            from sklearn import linear_model, preprocessing, svm
+
+            if metadata["modelClass"] == "SGDClassifier":
+                svmModel = linear_model.SGDClassifier(**metadata["modelParams"])
+            else:
+                svmModel = svm.LinearSVC(**metadata["modelParams"])
+            svmModel.coef_ = snapshot["coef"]
+            svmModel.intercept_ = snapshot["intercept"]
+            svmModel.classes_ = snapshot["classes"]
+            svmModel.n_features_in_ = svmModel.coef_.shape[1]
+            if "numUpdates" in snapshot:
+                svmModel.t_ = snapshot["numUpdates"].item()
+
+            scaler = None
+            if "scalerMean" in snapshot:
+                scaler = preprocessing.StandardScaler()
+                scaler.mean_ = snapshot["scalerMean"]
+                scaler.var_ = snapshot["scalerVar"]
+                scaler.scale_ = snapshot["scalerScale"]
+                scaler.n_samples_seen_ = snapshot["scalerNumSamplesSeen"][()]
+                scaler.n_features_in_ = len(scaler.mean_)
+
+        model = makeTrainedModel(svmModel, scaler, selectedInputs, self.numInputs)
+        with self.trainingDataLock:
+            self.model = model
+            self.hasBeenTrainedAtAll = True
+        return metadata
@@ -0,0 +1,430 @@
+import os
+import re
+import json
+import time
+import argparse
+import itertools
+import concurrent.futures
+from collections import namedtuple
+
+import numpy as np
+
+from channel_selection import SELECTION_METHODS
+from constants import LOG_FILE_PATH
+from decoder import Decoder, DIRECTION_VELOCITIES
+from features import FEATURES, FeatureExtractor
+from session_log import INDEX_FILE_NAME, readLogIndex, loadRun
+from training_data import DIRECTION_CODES
+
+
+# A run found in the log folder.
+#   playerId: ID of the run
+#   logFormat: "binary" (see session_log.BinarySessionLog) or "json" (see
+#       Player.writeLogLine)
+#   location: for "binary", the run's session_log.RunIndex, and for "json", the path
+#       of the log file the run's lines are in
+LoggedRun = namedtuple("LoggedRun", ["playerId", "logFormat", "location"])
+
+# A decoder configuration to evaluate.
+#   decoderMode: see Decoder
+#   features: tuple of features.FEATURES the decoder takes
+#   windowLength: of the window features
+#   selectionMethod: see Decoder (None to use all the inputs)
+#   numSelectedInputs: see Decoder
+Variant = namedtuple(
+    "Variant",
+    ["decoderMode", "features", "windowLength", "selectionMethod", "numSelectedInputs"],
+)
+
+# Finds the playerId of a line of a JSON log file, without parsing the whole line.
+PLAYER_ID_PATTERN = re.compile(r'"playerId": "([^"]+)"')
+
+
+def findLoggedRuns(logDirPath):
+    """Find every run logged in a folder, in either log format.
+
+    :param str logDirPath: e.g. "log"
+
+    :return list[LoggedRun] loggedRuns: in order of the log files' names (i.e. by
+        date), and in the order they were logged within each log file
+    """
+    loggedRuns = []
+    for name in sorted(os.listdir(logDirPath)):
+        path = os.path.join(logDirPath, name)
+        if os.path.isfile(os.path.join(path, INDEX_FILE_NAME)):
+            for runIndex in readLogIndex(path).values():
+                if runIndex.numRows > 0:
+                    loggedRuns.append(LoggedRun(runIndex.playerId, "binary", runIndex))
+        elif name.endswith(".txt"):
+            # Only pick the playerIds out of the lines, so as not to parse them all.
+            playerIds = {}
+            with open(path, "r") as f:
+                for line in f:
+                    match = PLAYER_ID_PATTERN.search(line)
+                    if match is not None:
+                        playerIds[match.group(1)] = True
+            for playerId in playerIds:
+                loggedRuns.append(LoggedRun(playerId, "json", path))
+    return loggedRuns
+
+
+def streamJsonRun(logFilePath, playerId, onlyCalibrating=False):
+    """Load a run's samples from a JSON log file, one line at a time, only parsing the
+    run's lines.
+
+    :param str logFilePath:
+    :param str playerId: ID of the run
+    :param bool onlyCalibrating: whether to only load the samples taken while the game
+        was calibrating
+
+    :return (np.array, np.array): measurements, shape (numSamples, numChannels), and
+        direction codes, shape (numSamples,)
+    """
+    playerIdMarker = f'"playerId": "{playerId}"'
+    measurements = []
+    directionCodes = []
+    with open(logFilePath, "r") as f:
+        for line in f:
+            if playerIdMarker not in line:
+                continue
+            log = json.loads(line)
+            if onlyCalibrating and not log["gameState"]["isCalibrating"]:
+                continue
+            measurements.append(log["measurements"])
+            directionCodes.append(DIRECTION_CODES[log["direction"]])
+    return np.array(measurements), np.array(directionCodes, dtype=np.int8)
+
+
+# A worker usually gets several variants of the same run in a row, so it keeps the
+# latest run it loaded, by (playerId, onlyCalibrating).
+_latestLoadedRun = {}
+
+
+def loadLoggedRun(loggedRun, onlyCalibrating=False):
+    """Load a run's samples, in either log format.
+
+    :param LoggedRun loggedRun:
+    :param bool onlyCalibrating: whether to only load the samples taken while the game
+        was calibrating
+
+    :return (np.array, np.array): measurements, shape (numSamples, numChannels), and
+        direction codes, shape (numSamples,). Binary logs are memory-mapped, so the
+        measurements are only read from disk when used.
+    """
+    key = (loggedRun.playerId, onlyCalibrating)
+    if key not in _latestLoadedRun:
+        _latestLoadedRun.clear()
+        if loggedRun.logFormat == "binary":
+            runData = loadRun(loggedRun.location, onlyCalibrating=onlyCalibrating)
+            _latestLoadedRun[key] = runData.measurements, runData.directionCodes
+        else:
+            _latestLoadedRun[key] = streamJsonRun(
+                loggedRun.location, loggedRun.playerId, onlyCalibrating
+            )
+    return _latestLoadedRun[key]
+
+
+def describeVariant(variant):
+    """Short name of a variant, e.g. "batch mean/5 anova:16".
+
+    :param Variant variant:
+
+    :return str:
+    """
+    description = f"{variant.decoderMode} {'+'.join(variant.features)}"
+    if {"mean", "variance"} & set(variant.features):
+        description += f"/{variant.windowLength}"
+    if variant.selectionMethod is not None:
+        description += f" {variant.selectionMethod}:{variant.numSelectedInputs}"
+    return description
+
+
+def evaluateVariant(loggedRun, variant, numFolds=5, onlyCalibrating=False):
+    """Cross-validate a decoder variant on a run: for each of numFolds contiguous
+    blocks of the run's samples, train on the rest, and decode the block one sample at
+    a time, as the player would.
+
+    Blocks are contiguous since consecutive samples are alike (their window features
+    overlap), so randomly picked held-out samples would be too easy.
+
+    :param LoggedRun loggedRun:
+    :param Variant variant:
+    :param int numFolds:
+    :param bool onlyCalibrating: whether to only use the samples taken while the game
+        was calibrating (otherwise, samples while playing are labeled by the direction
+        from the cursor to the target, like calibration samples)
+
+    :return dict results: accuracy (how often the decoded move is closest to the right
+        direction) mean and standard deviation across folds, mean time to train
+        (milliseconds) and to decode a sample (microseconds), and how many samples and
+        folds there were (folds whose training failed are left out)
+    """
+    measurements, directionCodes = loadLoggedRun(loggedRun, onlyCalibrating)
+    featureExtractor = FeatureExtractor(
+        measurements.shape[1],
+        windowLength=variant.windowLength,
+        features=variant.features,
+    )
+    features = featureExtractor.transformMany(measurements)
+    directionCodes = np.asarray(directionCodes)
+
+    accuracies = []
+    trainingTimes = []
+    decodeTimes = []
+    foldBounds = np.linspace(0, len(features), numFolds + 1).astype(int)
+    for start, end in zip(foldBounds[:-1], foldBounds[1:]):
+        if start == end:
+            continue
+        isTest = np.zeros(len(features), dtype=bool)
+        isTest[start:end] = True
+        decoder = Decoder(
+            (featureExtractor.numFeatures,),
+            mode=variant.decoderMode,
+            selectionMethod=variant.selectionMethod,
+            numSelectedInputs=variant.numSelectedInputs,
+        )
+        decoder.addManyToTrainingData(features[~isTest], directionCodes[~isTest])
+        startTime = time.perf_counter()
+        # In "online" mode, each training only learns from a bounded number of new
+        # samples, so keep training (as the player would) until it has learned from
+        # all of them, or stops making progress.
+        numSamplesTrainedOn = -1
+        while (
+            decoder.isNewDataSinceLastTrained
+            and decoder.numSamplesTrainedOn > numSamplesTrainedOn
+        ):
+            numSamplesTrainedOn = decoder.numSamplesTrainedOn
+            decoder.train()
+        trainingTimes.append(time.perf_counter() - startTime)
+        if not decoder.hasBeenTrainedAtAll:
+            continue
+
+        testFeatures = features[isTest]
+        moves = np.empty((len(testFeatures), 2))
+        startTime = time.perf_counter()
+        for idx, sampleFeatures in enumerate(testFeatures):
+            move = decoder.decode(sampleFeatures)["move"]
+            moves[idx] = move["x"], move["y"]
+        decodeTimes.append((time.perf_counter() - startTime) / len(testFeatures))
+        # Compare directions, since moves may be continuous (as in "kalman" mode).
+        decodedCodes = (moves @ DIRECTION_VELOCITIES.T).argmax(axis=1)
+        accuracies.append(np.mean(decodedCodes == directionCodes[isTest]))
+
+    return {
+        "numSamples": len(features),
+        "numFolds": len(accuracies),
+        "accuracy": np.mean(accuracies) if accuracies else np.nan,
+        "accuracyStdDev": np.std(accuracies) if accuracies else np.nan,
+        "trainingMs": 1000 * np.mean(trainingTimes) if trainingTimes else np.nan,
+        "decodeUs": 1e6 * np.mean(decodeTimes) if decodeTimes else np.nan,
+    }
+
+
+def evaluateAll(
+    loggedRuns, variants, numFolds=5, onlyCalibrating=False, numWorkers=None
+):
+    """Evaluate every variant on every run, in parallel across a pool of processes.
+
+    :param list[LoggedRun] loggedRuns:
+    :param list[Variant] variants:
+    :param int numFolds: see evaluateVariant
+    :param bool onlyCalibrating: see evaluateVariant
+    :param int|None numWorkers: how many processes, or None for one per CPU
+
+    :return dict[(str, Variant), dict] results: from evaluateVariant, by playerId and
+        variant
+    """
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=numWorkers) as executor:
+        # Submit each run's variants together, so that workers mostly get variants of
+        # the run they just loaded.
+        futures = {
+            executor.submit(
+                evaluateVariant, loggedRun, variant, numFolds, onlyCalibrating
+            ): (loggedRun.playerId, variant)
+            for loggedRun in loggedRuns
+            for variant in variants
+        }
+        for future in concurrent.futures.as_completed(futures):
+            playerId, variant = futures[future]
+            try:
+                results[playerId, variant] = future.result()
+            except Exception as e:
+                print(
+                    f"Evaluating {describeVariant(variant)} on {playerId} failed: {e}"
+                )
+    return results
+
+
+def parseSelection(selection):
+    """Parse a --selection value, "none" or e.g. "anova:16".
+
+    :param str selection:
+
+    :return (str|None, int): selectionMethod and numSelectedInputs (see Decoder)
+    """
+    if selection == "none":
+        return None, 16
+    method, _, numSelected = selection.partition(":")
+    if method not in SELECTION_METHODS or not numSelected.isdigit():
+        raise argparse.ArgumentTypeError(
+            f"Expected 'none' or METHOD:COUNT with METHOD one of {SELECTION_METHODS}, "
+            f"got {selection!r}"
+        )
+    return method, int(numSelected)
+
+
+def parseFeatures(features):
+    """Parse a --features value, e.g. "mean+variance".
+
+    :param str features:
+
+    :return tuple[str]:
+    """
+    features = tuple(features.split("+"))
+    unknownFeatures = set(features) - set(FEATURES)
+    if unknownFeatures:
+        raise argparse.ArgumentTypeError(f"Unknown features: {sorted(unknownFeatures)}")
+    return features
+
+
+def printResults(loggedRuns, variants, results):
+    """Print a table per run (one row per variant), then a summary across runs.
+
+    :param list[LoggedRun] loggedRuns:
+    :param list[Variant] variants:
+    :param dict results: from evaluateAll
+    """
+    nameWidth = max(len(describeVariant(variant)) for variant in variants) + 2
+    header = f"{'':<{nameWidth}}{'accuracy':>10}{'± std':>8}{'train ms':>10}"
+    header += f"{'decode us':>11}{'folds':>7}"
+    for loggedRun in loggedRuns:
+        runResults = [
+            results.get((loggedRun.playerId, variant)) for variant in variants
+        ]
+        numSamples = next((r["numSamples"] for r in runResults if r), 0)
+        print(f"\n{loggedRun.playerId} ({loggedRun.logFormat}, {numSamples} samples)")
+        print(header)
+        for variant, variantResults in zip(variants, runResults):
+            if variantResults is None:
+                continue
+            print(
+                f"{describeVariant(variant):<{nameWidth}}"
+                f"{variantResults['accuracy']:>10.3f}"
+                f"{variantResults['accuracyStdDev']:>8.3f}"
+                f"{variantResults['trainingMs']:>10.4g}"
+                f"{variantResults['decodeUs']:>11.4g}"
+                f"{variantResults['numFolds']:>7}"
+            )
+
+    print(f"\nMean across {len(loggedRuns)} runs")
+    print(f"{'':<{nameWidth}}{'accuracy':>10}{'train ms':>10}{'decode us':>11}")
+    for variant in variants:
+        variantResults = [
+            results[loggedRun.playerId, variant]
+            for loggedRun in loggedRuns
+            if (loggedRun.playerId, variant) in results
+        ]
+        print(
+            f"{describeVariant(variant):<{nameWidth}}"
+            + "".join(
+                f"{np.nanmean([r[name] for r in variantResults]):>{width}.4g}"
+                for name, width in (
+                    ("accuracy", 10),
+                    ("trainingMs", 10),
+                    ("decodeUs", 11),
+                )
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cross-validate decoder variants on every logged run, in parallel."
+    )
+    parser.add_argument(
+        "--log-dir", default=os.path.dirname(LOG_FILE_PATH), help="folder of logs"
+    )
+    parser.add_argument(
+        "--decoder-mode",
+        nargs="+",
+        default=["batch", "online", "kalman"],
+        choices=["batch", "online", "kalman"],
+    )
+    parser.add_argument(
+        "--features",
+        nargs="+",
+        type=parseFeatures,
+        default=[("mean",)],
+        help="feature sets to try, each like 'mean' or 'mean+variance'",
+    )
+    parser.add_argument("--window-length", type=int, nargs="+", default=[5])
+    parser.add_argument(
+        "--selection",
+        nargs="+",
+        type=parseSelection,
+        default=[(None, 16)],
+        help="channel selections to try, each 'none' or like 'anova:16'",
+    )
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument(
+        "--calibration-only",
+        action="store_true",
+        help="only use samples from calibration (by default, also ones from playing)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="processes (default: one per CPU)"
+    )
+    parser.add_argument("--output", default=None, help="also save results as JSON")
+    args = parser.parse_args()
+
+    loggedRuns = findLoggedRuns(args.log_dir)
+    if not loggedRuns:
+        print(f"No logged runs in {args.log_dir}.")
+        return
+    variants = [
+        Variant(decoderMode, features, windowLength, selectionMethod, numSelected)
+        for decoderMode, features, windowLength, (selectionMethod, numSelected) in (
+            itertools.product(
+                args.decoder_mode, args.features, args.window_length, args.selection
+            )
+        )
+    ]
+    # Variants whose features have no window don't differ by window length.
+    variants = list(
+        {describeVariant(variant): variant for variant in variants}.values()
+    )
+    print(
+        f"Evaluating {len(variants)} variants on {len(loggedRuns)} runs, with "
+        f"{args.folds}-fold cross-validation..."
+    )
+    startTime = time.perf_counter()
+    results = evaluateAll(
+        loggedRuns,
+        variants,
+        numFolds=args.folds,
+        onlyCalibrating=args.calibration_only,
+        numWorkers=args.workers,
+    )
+    print(f"Done in {time.perf_counter() - startTime:.1f}s.")
+    printResults(loggedRuns, variants, results)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(
+                [
+                    {
+                        "playerId": playerId,
+                        "variant": variant._asdict(),
+                        **variantResults,
+                    }
+                    for (playerId, variant), variantResults in results.items()
+                ],
+                f,
+                indent=2,
+            )
+        print(f"\nSaved results to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
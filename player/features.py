@@ -0,0 +1,194 @@
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+
+# Features that can be extracted from each channel.
+#   latest: the latest sample
+#   mean: mean of the samples in the window
+#   variance: variance of the samples in the window
+#   ema: exponential moving average of all the samples so far
+FEATURES = ("latest", "mean", "variance", "ema")
+
+
+class FeatureExtractor:
+    """Turns a stream of samples into a stream of feature vectors, made of statistics
+    of each channel over recent samples.
+
+    The statistics are kept up to date incrementally as each sample arrives (a sliding
+    window version of Welford's algorithm for the mean and variance), so each sample
+    costs O(numChannels) no matter how long the window is.
+
+    A feature vector is the selected features one after another, each with one value
+    per channel (e.g. with features ("mean", "variance"), the means of all channels,
+    then the variances of all channels).
+    """
+
+    def __init__(self, numChannels, windowLength=5, features=("mean",), emaAlpha=0.2):
+        """
+        :param int numChannels: how many channels each sample has
+        :param int windowLength: how many recent samples "mean" and "variance" are over
+        :param tuple[str] features: which of FEATURES to extract, in order
+        :param float emaAlpha: weight of each new sample in "ema" (between 0 and 1,
+            larger forgets faster)
+        """
+        unknownFeatures = set(features) - set(FEATURES)
+        if unknownFeatures:
+            raise ValueError(f"Unknown features: {sorted(unknownFeatures)}")
+        self.numChannels = numChannels
+        self.windowLength = windowLength
+        self.features = tuple(features)
+        self.emaAlpha = emaAlpha
+
+        # The feature vector, which each feature's statistic is kept in (or written
+        # to) directly, through a view per feature.
+        self._featureVector = np.zeros(len(self.features) * self.numChannels)
+        self._featureViews = {
+            feature: self._featureVector[
+                idx * self.numChannels : (idx + 1) * self.numChannels
+            ]
+            for idx, feature in enumerate(self.features)
+        }
+        # Samples in the window, to know which one leaves the window as each one
+        # arrives.
+        self.window = RingBuffer(self.windowLength, (self.numChannels,))
+        # Running mean of the window, and sum of squared differences from it.
+        self._mean = self._featureViews.get("mean", np.zeros(self.numChannels))
+        self._sumSquaredDiffs = np.zeros(self.numChannels)
+        self._doVariance = "variance" in self._featureViews
+        # Scratch space, so updating doesn't allocate.
+        self._diff = np.empty(self.numChannels)
+        self._scratch = np.empty(self.numChannels)
+        # How many samples have been seen.
+        self.numSamples = 0
+
+    @property
+    def numFeatures(self):
+        """Length of each feature vector."""
+        return len(self._featureVector)
+
+    def reset(self):
+        """Forget all samples seen so far."""
+        self._featureVector[:] = 0
+        self._mean[:] = 0
+        self._sumSquaredDiffs[:] = 0
+        self.window.clear()
+        self.numSamples = 0
+
+    def update(self, sample):
+        """Take in a new sample, and get the feature vector as of that sample.
+
+        :param np.array sample: shape (numChannels,)
+
+        :return np.array featureVector: shape (numFeatures,). This is the extractor's
+            own array, overwritten by the next update, so copy it to keep it.
+        """
+        views = self._featureViews
+        if "mean" in views or "variance" in views:
+            self._updateWindowStats(sample)
+            if "variance" in views:
+                np.divide(
+                    self._sumSquaredDiffs, len(self.window), out=views["variance"]
+                )
+                # Rounding can make it slightly negative when the true variance is 0.
+                np.maximum(views["variance"], 0, out=views["variance"])
+        if "latest" in views:
+            views["latest"][:] = sample
+        if "ema" in views:
+            ema = views["ema"]
+            if self.numSamples == 0:
+                ema[:] = sample
+            else:
+                np.subtract(sample, ema, out=self._scratch)
+                self._scratch *= self.emaAlpha
+                ema += self._scratch
+        self.numSamples += 1
+        return self._featureVector
+
+    def _updateWindowStats(self, sample):
+        """Add a sample to the window (and drop the oldest one if it is full), updating
+        the window's mean and sum of squared differences from the mean.
+        """
+        mean, diff, scratch = self._mean, self._diff, self._scratch
+        if len(self.window) < self.windowLength:
+            # Welford's algorithm for adding a sample.
+            n = len(self.window) + 1
+            np.subtract(sample, mean, out=diff)
+            diff /= n
+            mean += diff
+            if self._doVariance:
+                # The squared difference added is (sample - oldMean) * (sample -
+                # newMean).
+                diff *= n
+                np.subtract(sample, mean, out=scratch)
+                scratch *= diff
+                self._sumSquaredDiffs += scratch
+        else:
+            # Replace the oldest sample with the new one: the sum of squared
+            # differences changes by (sample - oldest) * (sample - newMean + oldest -
+            # oldMean).
+            oldest = self.window.view()[0]
+            np.subtract(sample, oldest, out=diff)
+            if self._doVariance:
+                np.add(sample, oldest, out=scratch)
+                scratch -= mean
+            diff /= self.windowLength
+            mean += diff
+            if self._doVariance:
+                scratch -= mean
+                diff *= self.windowLength
+                scratch *= diff
+                self._sumSquaredDiffs += scratch
+        self.window.append(sample)
+
+    def transformMany(self, samples):
+        """Get the feature vector as of each of a series of samples, as if they were
+        each passed to update() of a new FeatureExtractor, but all at once (e.g. to
+        train on a logged run). Doesn't change this extractor's state.
+
+        :param np.array samples: shape (numSamples, numChannels), in order
+
+        :return np.array featureVectors: shape (numSamples, numFeatures)
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        numSamples = len(samples)
+        featureVectors = np.empty((numSamples, self.numFeatures))
+        if numSamples == 0:
+            return featureVectors
+
+        if "mean" in self.features or "variance" in self.features:
+            # Window sums by differences of cumulative sums, of the samples relative to
+            # the first one so that the sums stay small.
+            centered = samples - samples[0]
+            cumSums = np.zeros((numSamples + 1, self.numChannels))
+            np.cumsum(centered, axis=0, out=cumSums[1:])
+            cumSquaredSums = np.zeros((numSamples + 1, self.numChannels))
+            np.cumsum(centered ** 2, axis=0, out=cumSquaredSums[1:])
+            ends = np.arange(1, numSamples + 1)
+            starts = np.maximum(ends - self.windowLength, 0)
+            counts = (ends - starts)[:, np.newaxis]
+            centeredMeans = (cumSums[ends] - cumSums[starts]) / counts
+            means = centeredMeans + samples[0]
+            variances = (cumSquaredSums[ends] - cumSquaredSums[starts]) / counts
+            variances -= centeredMeans ** 2
+            np.maximum(variances, 0, out=variances)
+
+        for idx, feature in enumerate(self.features):
+            columns = slice(idx * self.numChannels, (idx + 1) * self.numChannels)
+            if feature == "latest":
+                featureVectors[:, columns] = samples
+            elif feature == "mean":
+                featureVectors[:, columns] = means
+            elif feature == "variance":
+                featureVectors[:, columns] = variances
+            elif feature == "ema":
+                # ema[t] = alpha * sample[t] + (1 - alpha) * ema[t - 1], as a linear
+                # filter, starting from ema[0] = sample[0].
+                from scipy import signal
+
+                alpha = self.emaAlpha
+                initialConditions = ((1 - alpha) * samples[0])[np.newaxis]
+                featureVectors[:, columns], _ = signal.lfilter(
+                    [alpha], [1, alpha - 1], samples, axis=0, zi=initialConditions
+                )
+        return featureVectors
@@ -0,0 +1,416 @@
+import json
+import asyncio
+import argparse
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import websockets
+import websockets.exceptions
+
+from constants import HOST, PORT
+import wire_format
+
+
+class HeadlessGame:
+    """Stand-in for the browser game (game/src/main-scene.js), without any rendering,
+    for benchmarking a player (or PlayerServer) in a closed loop.
+
+    It speaks the same WebSocket API as the game: it sends GAME_UPDATE messages with
+    the cursor, the target, and whether it is calibrating, and moves the cursor by the
+    GAME_COMMAND messages it receives. Its game time is a virtual clock that advances
+    by tickInterval each tick, so it can run faster (or slower) than real time.
+
+    Positions are in the coordinates of GAME_UPDATE messages: like the game, they are
+    of the top-left corner of the cursor's or target's physics body, with y flipped to
+    increase upwards.
+    """
+
+    # Same as the game's smallest size (see game/src/game-constants.js).
+    GAME_WIDTH = 1200
+    GAME_HEIGHT = 800
+    # Same as the constants in main-scene.js (times in seconds instead of ms).
+    MOVE_GAIN = 400
+    PLAYER_SIZE = 20
+    TARGET_SIZE = 20
+    MIN_NEW_TARGET_DIST = min(GAME_WIDTH, GAME_HEIGHT) / 3
+    CALIBRATION_RADIUS = 150
+    GAME_UPDATE_MIN_INTERVAL = 0.01
+    GAME_UPDATE_MAX_INTERVAL = 1
+
+    def __init__(
+        self,
+        wsHost=HOST,
+        wsPort=PORT,
+        tickInterval=1 / 60,
+        speed=None,
+        lockstep=False,
+        commandTimeout=0.1,
+        calibrationTime=3,
+        useBinary=False,
+        randSeed=None,
+    ):
+        """
+        :param str wsHost: ip address where the player's ws server can be reached
+        :param int wsPort: port where the player's ws server can be reached
+        :param float tickInterval: game time (seconds) each tick advances the virtual
+            clock by (the browser game runs at 60 frames per second)
+        :param float|None speed: how many seconds of game time to play per second of
+            real time, or None to play as fast as possible. The player still measures
+            and decodes in real time, so at higher speeds it sends fewer commands per
+            second of game time (unless lockstep)
+        :param bool lockstep: whether, once the player has started sending commands,
+            each tick waits for a new command before advancing, so the player sends one
+            command per tick however fast the game runs
+        :param float commandTimeout: in lockstep, most real time (seconds) to wait for a
+            command before advancing anyway
+        :param float calibrationTime: game time (seconds) to calibrate for at the start
+            (like clicking the game's Calibrate button), or 0 to not calibrate
+        :param bool useBinary: whether to ask for the binary subprotocol (see
+            wire_format), instead of sending JSON
+        :param int|None randSeed: seed of where targets appear
+        """
+        self.wsHost = wsHost
+        self.wsPort = wsPort
+        self.tickInterval = tickInterval
+        self.speed = speed
+        self.lockstep = lockstep
+        self.commandTimeout = commandTimeout
+        self.calibrationTime = calibrationTime
+        self.useBinary = useBinary
+        self.randGenerator = np.random.default_rng(randSeed)
+
+        # Position of a body centered on the screen.
+        self.screenCenter = self.toGameUpdateCoordinates(
+            np.array([self.GAME_WIDTH / 2, self.GAME_HEIGHT / 2]), self.TARGET_SIZE
+        )
+        # Game time (seconds) on the virtual clock.
+        self.virtualTime = 0.0
+        # Real time.time() when the game started, which the virtual clock starts from
+        # in the timestamps of messages.
+        self.startedAt = None
+        self.isCalibrating = self.calibrationTime > 0
+        self.cursorPosition = self.screenCenter.copy()
+        self.targetPosition = self.getNewTargetPosition()
+        # Game time at which the current target appeared.
+        self.targetShownAt = 0.0
+        # Latest GAME_COMMAND received since the last tick (whose move the cursor takes
+        # for the next tick), and an event set whenever one arrives (created in run(),
+        # so that it belongs to the running event loop).
+        self.latestCommand = None
+        self.commandEvent = None
+
+        # Game state last sent, and game time when it was sent.
+        self.lastGameStateSent = None
+        self.lastGameUpdateSentTime = -np.inf
+
+        # Stats for the results.
+        self.numTicks = 0
+        self.numGameUpdatesSent = 0
+        self.numGameCommandsReceived = 0
+        self.numTicksWithCommand = 0
+        self.numLockstepTimeouts = 0
+        # Game time of the first command received after calibration.
+        self.firstCommandTime = None
+        # Game time it took to reach each target that appeared once the player was
+        # sending commands.
+        self.timesToTarget = []
+
+    def toGameUpdateCoordinates(self, center, radius):
+        """Position, as sent in GAME_UPDATE messages, of a body centered on a point.
+
+        :param np.array center: (x, y) on the game's screen (y increasing downwards)
+        :param float radius: of the body
+
+        :return np.array position: (x, y)
+        """
+        return np.array([center[0] - radius, self.GAME_HEIGHT - (center[1] - radius)])
+
+    def getNewTargetPosition(self):
+        """Pick a random target position that isn't trivially close to the cursor.
+
+        :return np.array position: (x, y)
+        """
+        # Like the game, try random positions, but cap how many times we try.
+        maxTries = 100
+        for _ in range(maxTries):
+            center = self.randGenerator.random(2) * (self.GAME_WIDTH, self.GAME_HEIGHT)
+            position = self.toGameUpdateCoordinates(center, self.TARGET_SIZE)
+            distance = np.hypot(*(position - self.cursorPosition))
+            if distance >= self.MIN_NEW_TARGET_DIST:
+                return position
+        raise RuntimeError("Unable to find new target position.")
+
+    def getGameState(self):
+        """The game state, as sent in GAME_UPDATE messages (see game/README.md).
+
+        :return dict gameState:
+        """
+        return {
+            "playerCursor": {
+                "x": float(self.cursorPosition[0]),
+                "y": float(self.cursorPosition[1]),
+                "radius": self.PLAYER_SIZE,
+            },
+            "target": {
+                "x": float(self.targetPosition[0]),
+                "y": float(self.targetPosition[1]),
+                "radius": self.TARGET_SIZE,
+            },
+            "isCalibrating": self.isCalibrating,
+        }
+
+    def tick(self):
+        """Advance the game by one tick of the virtual clock, like one frame of
+        main-scene.js's update().
+        """
+        self.virtualTime += self.tickInterval
+        self.numTicks += 1
+        command, self.latestCommand = self.latestCommand, None
+        if command is not None:
+            self.numTicksWithCommand += 1
+
+        self.isCalibrating = self.virtualTime < self.calibrationTime
+        if self.isCalibrating:
+            # Keep the target in the middle, and move the cursor around it in a circle.
+            self.targetPosition = self.screenCenter.copy()
+            angle = self.virtualTime / self.calibrationTime * 2 * np.pi
+            self.cursorPosition = (
+                self.screenCenter
+                + self.CALIBRATION_RADIUS * np.array([np.cos(angle), np.sin(angle)])
+            )
+            return
+
+        # Like the game, move at full speed in the direction of the latest command
+        # received since the last tick, or stay put if there was none.
+        if command is not None:
+            move = np.array([command["move"]["x"], command["move"]["y"]], dtype=float)
+            norm = np.hypot(*move)
+            if norm > 0:
+                self.cursorPosition += move / norm * self.MOVE_GAIN * self.tickInterval
+        # Keep the cursor's body inside the game's bounds.
+        np.clip(
+            self.cursorPosition,
+            (0, 2 * self.PLAYER_SIZE),
+            (self.GAME_WIDTH - 2 * self.PLAYER_SIZE, self.GAME_HEIGHT),
+            out=self.cursorPosition,
+        )
+
+        # Reaching the target.
+        distance = np.hypot(*(self.targetPosition - self.cursorPosition))
+        if distance < self.PLAYER_SIZE + self.TARGET_SIZE:
+            if (
+                self.firstCommandTime is not None
+                and self.targetShownAt >= self.firstCommandTime
+            ):
+                self.timesToTarget.append(self.virtualTime - self.targetShownAt)
+            self.targetPosition = self.getNewTargetPosition()
+            self.targetShownAt = self.virtualTime
+
+    async def sendGameUpdate(self, websocket):
+        """Send the game state, at most once per GAME_UPDATE_MIN_INTERVAL, and only if
+        it changed (but at least once per GAME_UPDATE_MAX_INTERVAL), like the game.
+
+        :param websockets.WebSocketClientProtocol websocket:
+        """
+        sinceLastSent = self.virtualTime - self.lastGameUpdateSentTime
+        if sinceLastSent < self.GAME_UPDATE_MIN_INTERVAL:
+            return
+        gameState = self.getGameState()
+        if (
+            sinceLastSent < self.GAME_UPDATE_MAX_INTERVAL
+            and gameState == self.lastGameStateSent
+        ):
+            return
+        timestamp = self.startedAt + self.virtualTime
+        if wire_format.isBinaryConnection(websocket):
+            msg = wire_format.encodeGameUpdate(gameState, timestamp * 1000)
+        else:
+            timestring = datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat(
+                timespec="milliseconds"
+            )
+            msgDict = {
+                "TYPE": "GAME_UPDATE",
+                "PAYLOAD": {"gameState": gameState, "timestring": timestring},
+            }
+            msg = json.dumps(msgDict)
+        await websocket.send(msg)
+        self.numGameUpdatesSent += 1
+        self.lastGameUpdateSentTime = self.virtualTime
+        self.lastGameStateSent = gameState
+
+    async def receiveLoop(self, websocket):
+        """Keep the latest GAME_COMMAND received, for the next tick to take.
+
+        :param websockets.WebSocketClientProtocol websocket:
+        """
+        async for message in websocket:
+            if isinstance(message, bytes):
+                gameCommand = wire_format.decodeGameCommand(message)
+            else:
+                messageDict = json.loads(message)
+                if messageDict["TYPE"] != "GAME_COMMAND":
+                    continue
+                gameCommand = messageDict["PAYLOAD"]
+            self.latestCommand = gameCommand
+            self.numGameCommandsReceived += 1
+            if self.firstCommandTime is None and not self.isCalibrating:
+                self.firstCommandTime = self.virtualTime
+            self.commandEvent.set()
+
+    async def waitForNextTick(self, realStartTime):
+        """Wait until it is time for the next tick: when the real time catches up with
+        the virtual clock (at the given speed), and, in lockstep, when a new command
+        arrives.
+
+        :param float realStartTime: time.perf_counter() when the game started
+        """
+        if self.speed is None:
+            # Still let the receiving loop run.
+            await asyncio.sleep(0)
+        else:
+            delay = realStartTime + self.virtualTime / self.speed - time.perf_counter()
+            await asyncio.sleep(max(delay, 0))
+        if self.lockstep and self.firstCommandTime is not None:
+            try:
+                await asyncio.wait_for(self.commandEvent.wait(), self.commandTimeout)
+            except asyncio.TimeoutError:
+                self.numLockstepTimeouts += 1
+
+    async def run(self, duration):
+        """Connect to the player, and play for some game time.
+
+        :param float duration: game time (seconds) to play for, including calibration
+
+        :return dict results: see getResults
+        """
+        uri = f"ws://{self.wsHost}:{self.wsPort}"
+        subprotocols = (
+            wire_format.SUBPROTOCOLS
+            if self.useBinary
+            else [wire_format.JSON_SUBPROTOCOL]
+        )
+        self.commandEvent = asyncio.Event()
+        async with websockets.connect(uri, subprotocols=subprotocols) as websocket:
+            receiveTask = asyncio.create_task(self.receiveLoop(websocket))
+            self.startedAt = time.time()
+            realStartTime = time.perf_counter()
+            try:
+                await self.sendGameUpdate(websocket)
+                while self.virtualTime < duration:
+                    self.commandEvent.clear()
+                    await self.waitForNextTick(realStartTime)
+                    self.tick()
+                    await self.sendGameUpdate(websocket)
+            except websockets.exceptions.ConnectionClosed:
+                print("Player closed the WebSocket connection.")
+            finally:
+                receiveTask.cancel()
+            realTime = time.perf_counter() - realStartTime
+        return self.getResults(realTime)
+
+    def getResults(self, realTime):
+        """Summarize how the game went.
+
+        :param float realTime: real time (seconds) the game ran for
+
+        :return dict results: game times (seconds) and rates (per second of game time)
+            of reaching targets, and message rates (per second of real time)
+        """
+        virtualTime = self.virtualTime
+        # Time spent playing, once the player started sending commands.
+        playingTime = (
+            virtualTime - self.firstCommandTime
+            if self.firstCommandTime is not None
+            else 0
+        )
+        timesToTarget = np.array(self.timesToTarget)
+        return {
+            "virtualTime": virtualTime,
+            "realTime": realTime,
+            "speed": virtualTime / realTime,
+            "timeToFirstCommand": (
+                self.firstCommandTime - self.calibrationTime
+                if self.firstCommandTime is not None
+                else np.nan
+            ),
+            "numTargetsReached": len(timesToTarget),
+            "targetsPerMinute": (
+                60 * len(timesToTarget) / playingTime if playingTime else np.nan
+            ),
+            "meanTimeToTarget": timesToTarget.mean() if len(timesToTarget) else np.nan,
+            "medianTimeToTarget": (
+                np.median(timesToTarget) if len(timesToTarget) else np.nan
+            ),
+            "gameUpdatesPerSecond": self.numGameUpdatesSent / realTime,
+            "gameCommandsPerSecond": self.numGameCommandsReceived / realTime,
+            "ticksWithCommand": self.numTicksWithCommand / max(self.numTicks, 1),
+            "lockstepTimeouts": self.numLockstepTimeouts,
+        }
+
+
+async def runGames(games, duration):
+    """Play several headless games at once (e.g. against a PlayerServer).
+
+    :param list[HeadlessGame] games:
+    :param float duration: game time (seconds) for each to play
+
+    :return list[dict] resultsPerGame:
+    """
+    return await asyncio.gather(*(game.run(duration) for game in games))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play the game headlessly against a running player (or server.py), "
+        "and report how well and how fast the whole loop plays."
+    )
+    parser.add_argument(
+        "--duration", type=float, default=30, help="game time (s), with calibration"
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=None,
+        help="game seconds per real second (default: as fast as possible)",
+    )
+    parser.add_argument(
+        "--lockstep",
+        action="store_true",
+        help="wait for a command from the player before each tick",
+    )
+    parser.add_argument("--calibration-time", type=float, default=3)
+    parser.add_argument("--binary", action="store_true")
+    parser.add_argument(
+        "--games",
+        type=int,
+        default=1,
+        help="games to play at once (use server.py to give each its own session)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    games = [
+        HeadlessGame(
+            speed=args.speed,
+            lockstep=args.lockstep,
+            calibrationTime=args.calibration_time,
+            useBinary=args.binary,
+            randSeed=args.seed + gameIdx,
+        )
+        for gameIdx in range(args.games)
+    ]
+    try:
+        resultsPerGame = asyncio.run(runGames(games, args.duration))
+    except KeyboardInterrupt:
+        print("\nReceived keyboard interrupt...")
+        return
+    # One column per game.
+    print(f"{'':<24}" + "".join(f"{f'game {idx}':>12}" for idx in range(len(games))))
+    for name in resultsPerGame[0]:
+        values = [results[name] for results in resultsPerGame]
+        print(f"{name:<24}" + "".join(f"{value:>12.5g}" for value in values))
+
+
+if __name__ == "__main__":
+    main()
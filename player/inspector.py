@@ -5,15 +5,20 @@ import time
 import websockets
 import websockets.exceptions
 
-import player
+from constants import HOST, PORT
+import wire_format
 
 
 async def REPL():
     """Display a prompt to type, send entered code to Player, and display the code
     result sent back from Player.
+
+    Code is evaluated against a snapshot of the Player's state, without pausing it,
+    unless another mode is picked with %mode (see wire_format.INSPECTION_MODES).
     """
     loop = asyncio.get_event_loop()
-    uri = f"ws://{player.HOST}:{player.PORT}"
+    uri = f"ws://{HOST}:{PORT}"
+    mode = wire_format.INSPECTION_MODES[0]
     while True:
         try:
             print("Attempting WebSocket connection...")
@@ -22,14 +27,29 @@ async def REPL():
                 while True:
                     # Without run_in_executor(), just plain input() hinders pinging that
                     # the websockets library does, causing connection errors.
-                    pythonCode = await loop.run_in_executor(None, lambda: input(">>> "))
+                    prompt = ">>> " if mode == "snapshot" else f"({mode}) >>> "
+                    pythonCode = await loop.run_in_executor(None, lambda: input(prompt))
                     # If nothing was typed, do nothing.
                     if not pythonCode:
                         continue
-                    msgDict = {
-                        "TYPE": "PYTHON_CODE",
-                        "PAYLOAD": {"pythonCode": pythonCode},
-                    }
+                    # Typing %mode <mode> changes how the code typed after it is
+                    # evaluated, e.g. "%mode pause" to pause the Player first.
+                    if pythonCode.strip().startswith("%mode"):
+                        newMode = pythonCode.strip()[len("%mode") :].strip()
+                        if newMode in wire_format.INSPECTION_MODES:
+                            mode = newMode
+                        else:
+                            modes = ", ".join(wire_format.INSPECTION_MODES)
+                            print(f"Mode is {mode} (can be one of: {modes}).")
+                        continue
+                    # Typing %metrics asks for the Player's latency metrics instead.
+                    if pythonCode.strip() == "%metrics":
+                        msgDict = {"TYPE": "GET_METRICS", "PAYLOAD": {}}
+                    else:
+                        msgDict = {
+                            "TYPE": "PYTHON_CODE",
+                            "PAYLOAD": {"pythonCode": pythonCode, "mode": mode},
+                        }
                     msg = json.dumps(msgDict)
                     try:
                         await websocket.send(msg)
@@ -38,6 +58,10 @@ async def REPL():
                         print("WebSocket connection closed.")
                         break
                     resultMsgDict = json.loads(resultMsg)
+                    if resultMsgDict["TYPE"] == "METRICS":
+                        metrics = resultMsgDict["PAYLOAD"]["metrics"]
+                        print(json.dumps(metrics, indent=2))
+                        continue
                     assert resultMsgDict["TYPE"] == "RESULT_OF_EVAL"
                     result = resultMsgDict["PAYLOAD"]["result"]
                     print(result)
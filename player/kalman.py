@@ -0,0 +1,174 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+# A Kalman filter fitted to training data, with the steady-state gain precomputed so
+# that each step of filtering is just a couple of matrix-vector products.
+#   The model is: state[t] = stateTransition @ state[t-1] + noise (processNoise
+#   covariance), and observation[t] = observationMatrix @ state[t] + observationOffset +
+#   noise (observationNoise covariance).
+#   stateTransition: (numStates, numStates) array
+#   processNoise: (numStates, numStates) array
+#   observationMatrix: (numObservations, numStates) array
+#   observationOffset: (numObservations,) array
+#   observationNoise: (numObservations, numObservations) array
+#   gain: contiguous (numStates, numObservations) array, the steady-state Kalman gain
+#   steadyStateTransition: (numStates, numStates) array, (I - gain @ observationMatrix)
+#       @ stateTransition
+#   gainOffset: (numStates,) array, -gain @ observationOffset
+#   observationIndices: if the model was fit on only some of the observations (see
+#       expandKalmanModel), their indices (the gain has zeros for the others), or None
+#   So each step is: state = steadyStateTransition @ state + gain @ observation +
+#   gainOffset
+KalmanModel = namedtuple(
+    "KalmanModel",
+    [
+        "stateTransition",
+        "processNoise",
+        "observationMatrix",
+        "observationOffset",
+        "observationNoise",
+        "gain",
+        "steadyStateTransition",
+        "gainOffset",
+        "observationIndices",
+    ],
+)
+
+
+def fitKalmanModel(states, observations, regularization=1e-6):
+    """Fit a Kalman filter's parameters to a time series of states and observations,
+    by least squares.
+
+    :param np.array states: shape (numSamples, numStates), consecutive in time
+    :param np.array observations: shape (numSamples, numObservations)
+    :param float regularization: added to the diagonal of the observation noise
+        covariance, so it can be inverted even if some observations hardly vary
+
+    :return KalmanModel:
+    """
+    numSamples, numStates = states.shape
+    if numSamples <= numStates + 1:
+        raise ValueError(
+            f"Need more than {numStates + 1} samples to fit a Kalman filter, got "
+            f"{numSamples}"
+        )
+
+    # Observation model: observations = states @ observationMatrix.T + offset.
+    statesWithOnes = np.column_stack((states, np.ones(numSamples)))
+    coefs, _, _, _ = np.linalg.lstsq(statesWithOnes, observations, rcond=None)
+    observationMatrix = coefs[:numStates].T
+    observationOffset = coefs[numStates]
+    residuals = observations - statesWithOnes @ coefs
+    observationNoise = residuals.T @ residuals / (numSamples - numStates - 1)
+    observationNoise[np.diag_indices_from(observationNoise)] += regularization
+
+    # State model: states[t] = states[t-1] @ stateTransition.T.
+    prevStates, nextStates = states[:-1], states[1:]
+    coefs, _, _, _ = np.linalg.lstsq(prevStates, nextStates, rcond=None)
+    stateTransition = coefs.T
+    residuals = nextStates - prevStates @ coefs
+    processNoise = residuals.T @ residuals / (numSamples - 1 - numStates)
+    processNoise[np.diag_indices_from(processNoise)] += regularization
+
+    return makeKalmanModel(
+        stateTransition,
+        processNoise,
+        observationMatrix,
+        observationOffset,
+        observationNoise,
+    )
+
+
+def makeKalmanModel(
+    stateTransition,
+    processNoise,
+    observationMatrix,
+    observationOffset,
+    observationNoise,
+    maxIterations=1000,
+    tolerance=1e-12,
+):
+    """Precompute the steady-state gain of a Kalman filter.
+
+    Uses the information form of the update, which only ever inverts
+    (numStates, numStates) matrices: with observation noise Q and observation matrix H,
+    H.T @ inv(Q) and H.T @ inv(Q) @ H are computed once, then the covariance is iterated
+    until it stops changing.
+
+    :param np.array stateTransition: (numStates, numStates)
+    :param np.array processNoise: (numStates, numStates)
+    :param np.array observationMatrix: (numObservations, numStates)
+    :param np.array observationOffset: (numObservations,)
+    :param np.array observationNoise: (numObservations, numObservations)
+    :param int maxIterations: most iterations to converge the covariance in
+    :param float tolerance: largest change of the covariance considered converged
+
+    :return KalmanModel:
+    """
+    A, W, H = stateTransition, processNoise, observationMatrix
+    # H.T @ inv(Q), by solving rather than inverting Q (which is symmetric).
+    HtQinv = np.linalg.solve(observationNoise, H).T
+    HtQinvH = HtQinv @ H
+
+    covariance = W
+    for _ in range(maxIterations):
+        predictedCovariance = A @ covariance @ A.T + W
+        newCovariance = np.linalg.inv(np.linalg.inv(predictedCovariance) + HtQinvH)
+        isConverged = np.abs(newCovariance - covariance).max() < tolerance
+        covariance = newCovariance
+        if isConverged:
+            break
+    gain = covariance @ HtQinv
+    steadyStateTransition = (np.eye(len(A)) - covariance @ HtQinvH) @ A
+
+    return KalmanModel(
+        stateTransition=stateTransition,
+        processNoise=processNoise,
+        observationMatrix=observationMatrix,
+        observationOffset=observationOffset,
+        observationNoise=observationNoise,
+        gain=np.ascontiguousarray(gain),
+        steadyStateTransition=steadyStateTransition,
+        gainOffset=-gain @ observationOffset,
+        observationIndices=None,
+    )
+
+
+def expandKalmanModel(model, observationIndices, numObservations):
+    """Make a model fit on some of the observations filter all of the observations, by
+    ignoring the others.
+
+    :param KalmanModel model: fit on observations[:, observationIndices]
+    :param np.array observationIndices: which observations the model was fit on
+    :param int numObservations: how many observations there are in all
+
+    :return KalmanModel: whose gain is (numStates, numObservations), with zeros for
+        the observations it wasn't fit on (the other parameters are unchanged)
+    """
+    gain = np.zeros((len(model.gainOffset), numObservations))
+    gain[:, observationIndices] = model.gain
+    return model._replace(gain=gain, observationIndices=observationIndices)
+
+
+def filterMany(model, observations, initialState=None):
+    """Run the filter over a time series of observations.
+
+    :param KalmanModel model:
+    :param np.array observations: shape (numSamples, numObservations)
+    :param np.array|None initialState: shape (numStates,), or None for zeros
+
+    :return np.array states: shape (numSamples, numStates), the estimate after each
+        observation
+    """
+    # The observations' contribution to every step, all at once.
+    states = observations @ model.gain.T
+    states += model.gainOffset
+    # Then carry the state from step to step.
+    state = np.zeros(len(model.gainOffset)) if initialState is None else initialState
+    steadyStateTransition = model.steadyStateTransition
+    for idx in range(len(states)):
+        states[idx] += steadyStateTransition @ state
+        state = states[idx]
+    return states
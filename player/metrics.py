@@ -0,0 +1,141 @@
+import time
+
+
+class LatencyHistogram:
+    """Histogram of latencies with a fixed relative precision (in the style of an HDR
+    histogram).
+
+    Values are recorded in whole microseconds. Values below 2^subBucketBits each get
+    their own bucket. Above that, each power-of-2 range is split into
+    2^(subBucketBits - 1) equal buckets, so any recorded value is known to within about
+    1 / 2^(subBucketBits - 1) of itself, whether it is 10us or 10s, with a small, fixed
+    number of buckets.
+    """
+
+    def __init__(self, subBucketBits=6, maxMagnitude=32):
+        """
+        :param int subBucketBits: more bits means more precision (and more buckets)
+        :param int maxMagnitude: how many power-of-2 ranges above 2^subBucketBits to
+            have buckets for (larger values are counted in the last bucket)
+        """
+        self.subBucketBits = subBucketBits
+        self.subBucketCount = 2 ** subBucketBits
+        self.subBucketHalfCount = self.subBucketCount // 2
+        numBuckets = self.subBucketCount + maxMagnitude * self.subBucketHalfCount
+        self.counts = [0] * numBuckets
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _indexOf(self, value):
+        """Bucket index of a value (in microseconds)."""
+        if value < self.subBucketCount:
+            return value
+        magnitude = value.bit_length() - self.subBucketBits
+        subBucket = value >> magnitude
+        idx = (
+            self.subBucketCount
+            + (magnitude - 1) * self.subBucketHalfCount
+            + (subBucket - self.subBucketHalfCount)
+        )
+        return min(idx, len(self.counts) - 1)
+
+    def _lowestValueAt(self, idx):
+        """Smallest value (in microseconds) that falls into a bucket."""
+        if idx < self.subBucketCount:
+            return idx
+        magnitude, offset = divmod(idx - self.subBucketCount, self.subBucketHalfCount)
+        return (self.subBucketHalfCount + offset) << (magnitude + 1)
+
+    def _highestValueAt(self, idx):
+        """Largest value (in microseconds) that falls into a bucket."""
+        return self._lowestValueAt(idx + 1) - 1
+
+    def record(self, seconds):
+        """Count one latency.
+
+        :param float seconds:
+        """
+        value = max(int(seconds * 1e6), 0)
+        self.counts[self._indexOf(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Value (in microseconds) that the given percent of recorded values are at or
+        below, or None if nothing is recorded.
+
+        This is the largest value of the bucket it falls in, kept within the recorded
+        min and max, so it never understates a latency, and min <= p50 <= p90 <= max.
+
+        :param float percent: e.g. 99.9
+        """
+        if self.count == 0:
+            return None
+        threshold = max(self.count * percent / 100, 1)
+        cumulativeCount = 0
+        for idx, count in enumerate(self.counts):
+            cumulativeCount += count
+            if cumulativeCount >= threshold:
+                return min(max(self._highestValueAt(idx), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """Summary statistics, in milliseconds.
+
+        :return dict:
+        """
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count / 1000,
+            "min": self.min / 1000,
+            "p50": self.percentile(50) / 1000,
+            "p90": self.percentile(90) / 1000,
+            "p99": self.percentile(99) / 1000,
+            "p99.9": self.percentile(99.9) / 1000,
+            "max": self.max / 1000,
+        }
+
+
+class Metrics:
+    """Named latency histograms, e.g. one per stage of the player's pipeline."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.startTime = time.perf_counter()
+
+    def record(self, name, seconds):
+        """Count one latency in the named histogram.
+
+        :param str name:
+        :param float seconds:
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def summary(self):
+        """Summary statistics of each histogram, in milliseconds.
+
+        :return dict:
+        """
+        return {
+            "uptime": time.perf_counter() - self.startTime,
+            "latenciesMs": {
+                name: histogram.summary()
+                for name, histogram in sorted(self.histograms.items())
+            },
+        }
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        self.histograms = {}
+        self.startTime = time.perf_counter()
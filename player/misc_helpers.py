@@ -10,3 +10,17 @@ def shiftSamples(samples, desiredRange):
     """
     newSamples = samples * (desiredRange[1] - desiredRange[0]) + desiredRange[0]
     return newSamples
+
+
+def readOnlyView(array):
+    """Make a view of an array that can't be written to (the array itself still can).
+
+    :param np.array|None array:
+
+    :returns np.array|None view: None if array is None
+    """
+    if array is None:
+        return None
+    view = array.view()
+    view.flags.writeable = False
+    return view
@@ -1,6 +1,9 @@
 import os
 import json
 import asyncio
+import copy
+import concurrent.futures
+from collections import namedtuple
 from datetime import datetime, timezone
 import traceback
 import time
@@ -9,19 +12,62 @@ import uuid
 import websockets
 import websockets.exceptions
 import numpy as np
-from matplotlib import pyplot as plt
 
+from constants import (
+    HOST,
+    PORT,
+    LOG_FILE_PATH,
+    BINARY_LOG_DIR_PATH,
+    DECODER_SNAPSHOT_DIR_PATH,
+)
 from decoder import Decoder
-from misc_helpers import shiftSamples
+from features import FeatureExtractor
+from metrics import Metrics
+from misc_helpers import readOnlyView, shiftSamples
+from ring_buffer import RingBuffer
+from session_log import BinarySessionLog
+from visualization import Visualizer
+import wire_format
 
 
-HOST = "localhost"
-PORT = 1530
-LOG_FILE_PATH = os.path.join("log", f"{datetime.today().strftime('%Y-%m-%d')}.txt")
-
 # Global storage so a user using inspector.py can save variables.
 g = {}
 
+# What of a Player's state can be inspected without pausing it (see
+# Player.makeInspectionSnapshot). Arrays are read-only, and won't change later.
+#   playerId, isPaused, decoderMode, hasBeenTrainedAtAll, numSamplesTrainedOn,
+#       selectedChannels: as on the Player (and its decoder)
+#   takenAt: when the snapshot was taken (time.time())
+#   gameState: copy of the latest game state
+#   currentMeasurements, currentFeatures: (numChannels,) and (numInputs,) arrays
+#   recentMeasurements: (numSteps, numChannels) array, oldest first
+#   trainingDataSize: how many training samples the decoder has
+#   numTrainingSamplesAdded: how many have ever been added (including evicted ones)
+#   model: the decoder's latest model (a TrainedModel, or KalmanModel in "kalman"
+#       mode, or None), whose arrays are read-only. Its scores are a copy of those of
+#       the latest decode, since decode() overwrites the model's own.
+PlayerSnapshot = namedtuple(
+    "PlayerSnapshot",
+    [
+        "playerId",
+        "takenAt",
+        "isPaused",
+        "gameState",
+        "currentMeasurements",
+        "currentFeatures",
+        "recentMeasurements",
+        "decoderMode",
+        "hasBeenTrainedAtAll",
+        "numSamplesTrainedOn",
+        "trainingDataSize",
+        "numTrainingSamplesAdded",
+        "model",
+        "selectedChannels",
+    ],
+)
+# Longest result of PYTHON_CODE in "snapshot" mode to send back, in characters.
+MAX_SNAPSHOT_RESULT_LENGTH = 2000
+
 
 class Player:
     """Fake player of game.
@@ -32,22 +78,85 @@ class Player:
     Hosts a WebSocket server with which to receive messages from other components.
     """
 
-    def __init__(self, wsHost, wsPort, doVisualization=False, doLogging=False):
+    def __init__(
+        self,
+        wsHost,
+        wsPort,
+        doVisualization=False,
+        doLogging=False,
+        decoderMode="batch",
+        lengthOfRecentMeasurements=30,
+        loggingBackend="json",
+        doMetrics=False,
+        maxTrainingSamples=None,
+        trainingExecutor=None,
+        warmStartDecoder=False,
+        saveDecoder=False,
+        randSeed=None,
+        featureWindowLength=5,
+        features=("mean",),
+        inputSelectionMethod=None,
+        numSelectedInputs=16,
+        numChannels=192,
+        visualizedChannels=None,
+        visualizationWindowLength=1000,
+    ):
         """
         :param str wsHost: ip address where this player's ws server can be reached
         :param int wsPort: port where this player's ws server can be reached
-        :param bool doVisualization:
+        :param bool doVisualization: whether to chart the measurements in real time (in
+            another process, see visualization.Visualizer)
+        :param str decoderMode: "batch", "online", or "kalman" (see Decoder)
+        :param int lengthOfRecentMeasurements: how many steps of recent measurements to
+            remember
+        :param str loggingBackend: if doLogging, "json" to log a JSON line to
+            LOG_FILE_PATH every 100ms, or "binary" to log every sample to a
+            BinarySessionLog in BINARY_LOG_DIR_PATH
+        :param bool doMetrics: whether to keep latency histograms of each stage from
+            receiving a game update to sending a game command (see GET_METRICS in
+            README)
+        :param int|None maxTrainingSamples: most training samples for the decoder to
+            keep, or None to keep all of them
+        :param concurrent.futures.Executor|None trainingExecutor: where to train the
+            decoder, e.g. a worker pool shared by the sessions of a PlayerServer, or
+            None for this player to have its own worker thread
+        :param bool warmStartDecoder: whether to start from the latest decoder snapshot
+            in DECODER_SNAPSHOT_DIR_PATH of a run with the same randSeed, features, and
+            decoder mode (if any), so decoding starts right away. Without a randSeed,
+            the decoder starts untrained, since a snapshot only works for the same player
+        :param bool saveDecoder: whether to save a snapshot of the trained decoder to
+            DECODER_SNAPSHOT_DIR_PATH in tearDown
+        :param int|None randSeed: seed of the simulated player's randomness. Runs with
+            the same seed simulate the same player, so a decoder trained in one run
+            still works in the next
+        :param int featureWindowLength: how many recent measurements the decoder's
+            window features (e.g. the mean of each channel) are over
+        :param tuple[str] features: which features (see features.FEATURES) of the
+            measurements the decoder is trained on and decodes
+        :param str|None inputSelectionMethod: to train the decoder on only the most
+            useful features, how to pick them (see channel_selection.SELECTION_METHODS),
+            or None to use all of them
+        :param int numSelectedInputs: how many features to pick, if
+            inputSelectionMethod
+        :param int numChannels: how many things the simulated player has measured
+        :param list[int]|None visualizedChannels: if doVisualization, which channels to
+            chart, or None for the direction-tuned ones
+        :param int visualizationWindowLength: if doVisualization, how many of the latest
+            measurements to chart
         """
         # How many things can we measure (e.g. how many sensors, or electrodes, etc.).
-        self.numChannels = 192
+        self.numChannels = numChannels
         # Generator of randomness.
-        self.randGenerator = np.random.default_rng()
+        self.randGenerator = np.random.default_rng(randSeed)
+        self.randSeed = randSeed
         # Current readings of the sensors.
         self.currentMeasurements = None
-        # Keep some recent history of measurements.
-        self.recentMeasurements = np.empty((0, self.numChannels))
         # How many steps of recent measurements to remember.
-        self.lengthOfRecentMeasurements = 30
+        self.lengthOfRecentMeasurements = lengthOfRecentMeasurements
+        # Keep some recent history of measurements.
+        self.measurementHistory = RingBuffer(
+            self.lengthOfRecentMeasurements, (self.numChannels,)
+        )
         # Mean value of each channel when no input from game.
         self.restingMeansRange = (5, 25)
         self.restingMeans = shiftSamples(
@@ -72,7 +181,42 @@ class Player:
         self.directionTunedMeanShift = 4
 
         # Decoder trained to look at the measurements and decide what to do in the game.
-        self.decoder = Decoder(inputShape=(self.numChannels,))
+        # Turns each new measurement into the features the decoder works with,
+        # incrementally updated statistics of the recent measurements.
+        self.featureExtractor = FeatureExtractor(
+            self.numChannels, windowLength=featureWindowLength, features=features
+        )
+        # Features of the current measurements.
+        self.currentFeatures = None
+        self.decoder = Decoder(
+            inputShape=(self.featureExtractor.numFeatures,),
+            mode=decoderMode,
+            maxTrainingSamples=maxTrainingSamples,
+            selectionMethod=inputSelectionMethod,
+            numSelectedInputs=numSelectedInputs,
+        )
+        self.saveDecoder = saveDecoder
+        if warmStartDecoder and randSeed is None:
+            print(
+                "Not warm-starting the decoder, since without a randSeed the simulated "
+                "player differs from any snapshot's."
+            )
+        elif warmStartDecoder:
+            loadedSnapshot = self.decoder.loadLatestSnapshot(
+                DECODER_SNAPSHOT_DIR_PATH,
+                expectedMetadata=self.getDecoderSnapshotMetadata(),
+            )
+            if loadedSnapshot is None:
+                print("No decoder snapshot to warm-start from.")
+            else:
+                print(f"Warm-started decoder from {loadedSnapshot[0]}.")
+        # Worker thread in which to train the decoder, so training doesn't block the
+        # event loop, and the future of the training currently running (if any).
+        self.ownsTrainingExecutor = trainingExecutor is None
+        if self.ownsTrainingExecutor:
+            trainingExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.trainingExecutor = trainingExecutor
+        self.trainingFuture = None
 
         # Parameters of WebSocket server used to receive messages from other components.
         self.wsHost = wsHost
@@ -81,29 +225,93 @@ class Player:
         self.gameWebSocket = None
         # Latest state we've heard from the game.
         self.gameState = None
-
-        # Real-time visualization of measurements.
-        numSpecialChannels = 4  # currently just 4 direction-tuned channels
-        self.lines = {}
-        self.fig, self.axs = plt.subplots(numSpecialChannels)
+        # Latest GAME_UPDATE message received but not handled yet, as (message,
+        # websocket, receivedAt). Only the latest one matters, so they aren't parsed as
+        # they arrive, just stored here until the next measurement, which parses and
+        # handles only the latest one.
+        self.pendingGameUpdate = None
+
+        # Real-time visualization of measurements, drawn by another process.
+        self.visualizer = None
         self.doVisualization = doVisualization
         if self.doVisualization:
-            self.initializeVisualization()
+            self.visualizer = self.makeVisualizer(
+                visualizedChannels, visualizationWindowLength
+            )
+
+        # Player ID to identify a given run.
+        self.playerId = str(uuid.uuid4())
 
         # Logging.
         self.logFile = None
+        self.sessionLog = None
         self.doLogging = doLogging
+        self.loggingBackend = loggingBackend
         if self.doLogging:
-            self.logFile = open(LOG_FILE_PATH, "a+")
-
-        # Player ID to identify a given run.
-        self.playerId = str(uuid.uuid4())
-
-        # Allow pausing of all coroutines to let a human inspect things.
+            if self.loggingBackend == "binary":
+                self.sessionLog = BinarySessionLog(
+                    BINARY_LOG_DIR_PATH, self.playerId, self.numChannels
+                )
+            else:
+                self.logFile = open(LOG_FILE_PATH, "a+")
+
+        # Allow pausing of all coroutines to let a human inspect things. The event is
+        # set whenever not paused, so coroutines can wait on it (it is created in
+        # runLoops(), so that it belongs to the running event loop).
         self.isPaused = False
+        self.unpausedEvent = None
+
+        # Queue by which (the features of) each new measurement is handed from the
+        # measurement loop to the decoding loop (created in runLoops()). It holds only
+        # the latest measurement, so if decoding falls behind (e.g. the game's
+        # WebSocket is slow to accept commands), stale measurements are dropped rather
+        # than piling up.
+        self.measurementQueue = None
+
+        # Latency instrumentation, or None if not doing it (in which case none of the
+        # timestamps below are taken).
+        self.metrics = Metrics() if doMetrics else None
+        # When (time.perf_counter()) the latest game state arrived.
+        self.gameStateReceivedAt = None
+        # When the game state that the current measurements are based on arrived.
+        self.currentMeasurementsGameStateReceivedAt = None
+
+    @property
+    def recentMeasurements(self):
+        """Recent measurements, oldest first, shape (numSteps, numChannels). This is a
+        view into the measurement history, so copy it to keep it.
+        """
+        return self.measurementHistory.view()
 
     async def start(self):
-        """Kick off the various loops this player performs."""
+        """Kick off the various loops this player performs, and the WebSocket server."""
+        tasks = [
+            # Task for the player's own loops.
+            asyncio.create_task(self.runLoops()),
+            # Task for listening for WebSocket connections and messages.
+            websockets.serve(
+                self.connectionHandler,
+                self.wsHost,
+                self.wsPort,
+                subprotocols=wire_format.SUBPROTOCOLS,
+            ),
+        ]
+        # Task for measuring event loop lag.
+        if self.metrics is not None:
+            tasks.append(asyncio.create_task(self.eventLoopLagLoop()))
+
+        # Run all the tasks.
+        await asyncio.gather(*tasks)
+
+    async def runLoops(self):
+        """Run the various loops this player performs (but not a WebSocket server, so
+        that a PlayerServer can run many players behind its own).
+        """
+        self.unpausedEvent = asyncio.Event()
+        if not self.isPaused:
+            self.unpausedEvent.set()
+        self.measurementQueue = asyncio.Queue(maxsize=1)
+
         tasks = [
             # Task for taking measurements.
             asyncio.create_task(self.measurementLoop()),
@@ -111,53 +319,180 @@ class Player:
             asyncio.create_task(self.trainingLoop()),
             # Task for decoding the measurements and sending game commands.
             asyncio.create_task(self.decodingLoop()),
-            # Task for listening for WebSocket connections and messages.
-            websockets.serve(self.connectionHandler, self.wsHost, self.wsPort),
         ]
-        # Task for real-time data visualization.
-        if self.doVisualization:
-            tasks.append(asyncio.create_task(self.visualizationLoop()))
-        # Task for logging.
-        if self.doLogging:
+        # Task for logging. (The binary logging backend logs every sample as it is
+        # measured instead.)
+        if self.doLogging and self.sessionLog is None:
             tasks.append(asyncio.create_task(self.loggingLoop()))
 
-        # Run all the tasks.
-        await asyncio.gather(*tasks)
+        # Run all the tasks, and stop them all if this is cancelled.
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
 
     def tearDown(self):
-        """Clean up for the end of the program."""
-        if self.doLogging:
+        """Clean up for the end of the program (or of the session)."""
+        if self.saveDecoder and self.decoder.hasBeenTrainedAtAll:
+            self.saveDecoderSnapshot()
+        if self.logFile is not None:
             self.logFile.close()
+        if self.sessionLog is not None:
+            self.sessionLog.close()
+        if self.visualizer is not None:
+            self.visualizer.close()
+        if self.ownsTrainingExecutor:
+            self.trainingExecutor.shutdown(wait=False)
+
+    def saveDecoderSnapshot(self):
+        """Save a snapshot of the decoder to DECODER_SNAPSHOT_DIR_PATH.
+
+        :return str snapshotPath:
+        """
+        os.makedirs(DECODER_SNAPSHOT_DIR_PATH, exist_ok=True)
+        # Start with the UTC time, so later snapshots are greater file names.
+        timestring = datetime.now(tz=timezone.utc).strftime("%Y-%m-%dT%H-%M-%S")
+        snapshotPath = os.path.join(
+            DECODER_SNAPSHOT_DIR_PATH, f"{timestring}-{self.playerId}.npz"
+        )
+        self.decoder.saveSnapshot(
+            snapshotPath,
+            metadata={"playerId": self.playerId, **self.getDecoderSnapshotMetadata()},
+        )
+        print(f"Saved decoder snapshot to {snapshotPath}.")
+        return snapshotPath
+
+    def getDecoderSnapshotMetadata(self):
+        """What a decoder snapshot is saved with, which must be the same to load it, so
+        that it's only loaded for the same simulated player and features.
+
+        :return dict metadata:
+        """
+        return {
+            "randSeed": self.randSeed,
+            "numChannels": self.numChannels,
+            "features": self.featureExtractor.features,
+            "featureWindowLength": self.featureExtractor.windowLength,
+            "emaAlpha": self.featureExtractor.emaAlpha,
+        }
+
+    @property
+    def selectedChannels(self):
+        """Which features of which channels the decoder picked to be trained on (e.g.
+        to compare with directionTunedIndices from the inspector).
+
+        :return list[(str, int)]|None: (feature, channel index) pairs, or None if the
+            decoder uses all the features (or hasn't been trained yet)
+        """
+        selectedInputs = self.decoder.selectedInputs
+        if selectedInputs is None:
+            return None
+        return [
+            (
+                self.featureExtractor.features[inputIdx // self.numChannels],
+                inputIdx % self.numChannels,
+            )
+            for inputIdx in selectedInputs.tolist()
+        ]
+
+    def makeInspectionSnapshot(self):
+        """Capture the state worth inspecting, cheaply enough to do for every
+        PYTHON_CODE message without holding up the loops.
+
+        Only what is small or about to be overwritten is copied. The latest features
+        and the model's parameter arrays are never changed once made (new ones replace
+        them), so they are only wrapped in read-only views. The model's scores are
+        overwritten by every decode, and its sklearn objects and game commands could be
+        changed in place, but they are all small, so they are copied.
+
+        :return PlayerSnapshot:
+        """
+        model = self.decoder.model
+        if model is not None:
+            model = model._replace(
+                **{
+                    field: (
+                        readOnlyView(value.copy() if field == "scores" else value)
+                        if isinstance(value, np.ndarray)
+                        else copy.deepcopy(value)
+                    )
+                    for field, value in model._asdict().items()
+                }
+            )
+        currentMeasurements = self.currentMeasurements
+        if currentMeasurements is not None:
+            currentMeasurements = readOnlyView(currentMeasurements.copy())
+        return PlayerSnapshot(
+            playerId=self.playerId,
+            takenAt=time.time(),
+            isPaused=self.isPaused,
+            gameState=copy.deepcopy(self.gameState),
+            currentMeasurements=currentMeasurements,
+            currentFeatures=readOnlyView(self.currentFeatures),
+            recentMeasurements=readOnlyView(self.recentMeasurements.copy()),
+            decoderMode=self.decoder.mode,
+            hasBeenTrainedAtAll=self.decoder.hasBeenTrainedAtAll,
+            numSamplesTrainedOn=self.decoder.numSamplesTrainedOn,
+            trainingDataSize=self.decoder.trainingData.size,
+            numTrainingSamplesAdded=self.decoder.trainingData.numAdded,
+            model=model,
+            selectedChannels=self.selectedChannels,
+        )
 
     async def loopWhilePaused(self):
         """Block until the program is unpaused.
 
         Call this at the top of every coroutine's loop to allow pausing of everything.
         """
-        pauseInterval = 0.01
-        while self.isPaused:
-            await asyncio.sleep(pauseInterval)
+        if self.isPaused:
+            await self.unpausedEvent.wait()
+
+    async def waitForTraining(self):
+        """Wait for the training running in the worker thread (if any) to finish, since
+        pausing doesn't stop it from swapping in its model.
+        """
+        if self.trainingFuture is not None:
+            await asyncio.wait([self.trainingFuture])
 
     def pause(self):
         """Pause all the coroutine loops."""
         print("Pausing...")
         self.isPaused = True
+        if self.unpausedEvent is not None:
+            self.unpausedEvent.clear()
 
     def unpause(self):
         """Unpause all the coroutine loops."""
         print("Unpausing...")
         self.isPaused = False
+        if self.unpausedEvent is not None:
+            self.unpausedEvent.set()
 
     async def measurementLoop(self):
         """Repeatedly read the sensors and store the values we see. We pretend that the
         player is playing the game and thus the measurements we get depend on what is
         happening in the game.
+
+        Measurements are taken at a fixed rate, scheduled from when the loop started
+        rather than from when the previous measurement finished, so the time spent
+        measuring doesn't make the rate drift.
         """
         measurementInterval = 0.01
+        loop = asyncio.get_running_loop()
+        nextMeasurementTime = loop.time()
         while True:
             await self.loopWhilePaused()
+            self.handlePendingGameUpdate()
             self.updateMeasurements(self.gameState)
-            await asyncio.sleep(measurementInterval)
+            nextMeasurementTime += measurementInterval
+            delay = nextMeasurementTime - loop.time()
+            # If we fell behind (e.g. from being paused), start the schedule over
+            # instead of taking a burst of measurements to catch up.
+            if delay < 0:
+                nextMeasurementTime = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
 
     def updateMeasurements(self, gameState):
         """Based on the state of the game, generate new values for this player's current
@@ -188,14 +523,37 @@ class Player:
 
         # Update currentMeasurements.
         self.currentMeasurements = newMeasurements
-        # Update recentMeasurements.
-        self.recentMeasurements = np.vstack((self.recentMeasurements, newMeasurements))
-        if len(self.recentMeasurements) > self.lengthOfRecentMeasurements:
-            self.recentMeasurements = self.recentMeasurements[1:]
+        # Update the history of recent measurements.
+        self.measurementHistory.append(newMeasurements)
+        # Hand the new measurements to the visualization process.
+        if self.visualizer is not None:
+            self.visualizer.append(newMeasurements)
+        # Update the features (copied, since the extractor reuses its array).
+        self.currentFeatures = self.featureExtractor.update(newMeasurements).copy()
+        # Log every sample, if using the binary logging backend.
+        if self.sessionLog is not None:
+            self.sessionLog.append(newMeasurements, gameState, direction, time.time())
+        takenAt = None
+        if self.metrics is not None:
+            takenAt = time.perf_counter()
+            # Only count the first measurement based on each game state.
+            if self.gameStateReceivedAt != self.currentMeasurementsGameStateReceivedAt:
+                self.metrics.record(
+                    "gameUpdateToMeasurement", takenAt - self.gameStateReceivedAt
+                )
+            self.currentMeasurementsGameStateReceivedAt = self.gameStateReceivedAt
+        # Hand the new features to the decoding loop, replacing any it hasn't gotten to
+        # yet.
+        if self.measurementQueue is not None:
+            if self.measurementQueue.full():
+                self.measurementQueue.get_nowait()
+            self.measurementQueue.put_nowait(
+                (self.currentFeatures, self.gameStateReceivedAt, takenAt)
+            )
 
         # If calibrating, update the decoder's training data.
         if self.gameState["isCalibrating"]:
-            self.decoder.addToTrainingData(self.currentMeasurements, direction)
+            self.decoder.addToTrainingData(self.currentFeatures, direction)
 
     @staticmethod
     def getDirectionFromGameState(gameState):
@@ -223,34 +581,53 @@ class Player:
 
     async def trainingLoop(self):
         """Periodically train the model on the training data received so far. Don't
-        re-train if no new data has arrived.
+        re-train if no new data has arrived. (In "online" decoder mode, each training
+        only consumes a bounded amount of the new data.)
+
+        Training runs in a worker thread, and the decoder swaps in the new model when it
+        is done. Don't start another training while one is still running.
         """
         trainingInterval = 1
+        loop = asyncio.get_running_loop()
         while True:
             await self.loopWhilePaused()
-            if self.decoder.isNewDataSinceLastTrained:
-                self.decoder.train()
+            isTrainingRunning = (
+                self.trainingFuture is not None and not self.trainingFuture.done()
+            )
+            if self.decoder.isNewDataSinceLastTrained and not isTrainingRunning:
+                self.trainingFuture = loop.run_in_executor(
+                    self.trainingExecutor, self.decoder.train
+                )
+                if self.metrics is not None:
+                    trainingStartTime = time.perf_counter()
+                    self.trainingFuture.add_done_callback(
+                        lambda _, startTime=trainingStartTime: self.metrics.record(
+                            "training", time.perf_counter() - startTime
+                        )
+                    )
             await asyncio.sleep(trainingInterval)
 
     async def decodingLoop(self):
-        """Repeatedly decode the current measurements to generate commands to send to
-        the game, since the measurements should hold the info (in a non-obvious way,
-        hence the need for the decoder) of what's happening in the game.
+        """Decode each new measurement to generate commands to send to the game, since
+        the measurements should hold the info (in a non-obvious way, hence the need for
+        the decoder) of what's happening in the game.
+
+        Wakes up as soon as the measurement loop hands over a new measurement, and
+        waits for each command to be sent before taking the next measurement (see
+        measurementQueue for what happens to measurements in the meantime).
         """
-        gameCommandInterval = 0.01
         while True:
+            queueItem = await self.measurementQueue.get()
+            features, gameStateReceivedAt, takenAt = queueItem
             await self.loopWhilePaused()
-            if (
-                self.currentMeasurements is not None
-                and self.gameWebSocket is not None
-                and self.decoder.hasBeenTrainedAtAll
-            ):
-                timestring = datetime.now(tz=timezone.utc).isoformat()
-                gameCommand = self.decoder.decode(self.currentMeasurements)
+            if self.gameWebSocket is not None and self.decoder.hasBeenTrainedAtAll:
+                if self.metrics is not None:
+                    decodeStartTime = time.perf_counter()
+                gameCommand = self.decoder.decode(features)
                 if gameCommand is not None:
-                    gameCommand["timestring"] = timestring
-                    msgDict = {"TYPE": "GAME_COMMAND", "PAYLOAD": gameCommand}
-                    msg = json.dumps(msgDict)
+                    msg = self.makeGameCommandMsg(gameCommand, self.gameWebSocket)
+                    if self.metrics is not None:
+                        sendStartTime = time.perf_counter()
                     try:
                         await self.gameWebSocket.send(msg)
                     except websockets.exceptions.ConnectionClosed:
@@ -258,7 +635,62 @@ class Player:
                             "In decoder loop, found Game WebSocket connection closed."
                         )
                         self.gameWebSocket = None
-            await asyncio.sleep(gameCommandInterval)
+                    if self.metrics is not None:
+                        self.recordDecodingMetrics(
+                            gameStateReceivedAt,
+                            takenAt,
+                            decodeStartTime,
+                            sendStartTime,
+                        )
+
+    def recordDecodingMetrics(
+        self, gameStateReceivedAt, takenAt, decodeStartTime, sendStartTime
+    ):
+        """Record the latencies of decoding measurements and sending the command.
+
+        All times are from time.perf_counter().
+
+        :param float gameStateReceivedAt: when the game state the measurements are
+            based on arrived
+        :param float takenAt: when the measurements were taken
+        :param float decodeStartTime: when decoding started
+        :param float sendStartTime: when sending started
+        """
+        now = time.perf_counter()
+        self.metrics.record("measurementToDecode", decodeStartTime - takenAt)
+        self.metrics.record("decode", sendStartTime - decodeStartTime)
+        self.metrics.record("send", now - sendStartTime)
+        self.metrics.record("gameUpdateToGameCommand", now - gameStateReceivedAt)
+
+    async def eventLoopLagLoop(self):
+        """Repeatedly measure how much later than asked for a sleep wakes up, which is
+        how long something else blocked the event loop.
+        """
+        lagInterval = 0.05
+        while True:
+            startTime = time.perf_counter()
+            await asyncio.sleep(lagInterval)
+            lag = time.perf_counter() - startTime - lagInterval
+            self.metrics.record("eventLoopLag", lag)
+
+    @staticmethod
+    def makeGameCommandMsg(gameCommand, websocket):
+        """Make the GAME_COMMAND message to send, in the format negotiated for the
+        connection it will be sent on.
+
+        :param dict gameCommand: from Decoder.decode
+        :param websockets.WebSocketServerProtocol websocket:
+
+        :return str|bytes msg:
+        """
+        if wire_format.isBinaryConnection(websocket):
+            return wire_format.encodeGameCommand(gameCommand, time.time() * 1000)
+        timestring = datetime.now(tz=timezone.utc).isoformat()
+        # Copy, rather than add to, the decoder's game command, since the decoder
+        # reuses it.
+        payload = {**gameCommand, "timestring": timestring}
+        msgDict = {"TYPE": "GAME_COMMAND", "PAYLOAD": payload}
+        return json.dumps(msgDict)
 
     async def connectionHandler(self, websocket, path):
         """Called once per connection to this component's WebSocket server. Simply keep
@@ -270,13 +702,27 @@ class Player:
         :param str path:
         """
         _ = path
-        print("WebSocket connection open.")
-        # Forever loop and receive incoming WebSocket messages.
+        print(f"WebSocket connection open (subprotocol: {websocket.subprotocol}).")
+        # Forever loop and receive incoming WebSocket messages. Binary messages are in
+        # the format negotiated via subprotocol (see wire_format), all others are JSON.
         async for message in websocket:
-            messageDict = json.loads(message)
+            if wire_format.isGameUpdate(message):
+                self.receiveGameUpdate(message, websocket)
+                continue
+            messageDict = wire_format.decodeMessage(message)
             await self.messageHandler(messageDict, websocket)
         print("WebSocket connection closed.")
 
+    def receiveGameUpdate(self, message, websocket):
+        """Set aside a GAME_UPDATE message, replacing any not handled yet (see
+        pendingGameUpdate).
+
+        :param str|bytes message: the unparsed GAME_UPDATE message
+        :param websockets.WebSocketServerProtocol websocket: connection it came on
+        """
+        receivedAt = time.perf_counter() if self.metrics is not None else None
+        self.pendingGameUpdate = (message, websocket, receivedAt)
+
     async def messageHandler(self, messageDict, websocket):
         """Called once per incoming WebSocket message.
 
@@ -286,70 +732,102 @@ class Player:
         """
         if messageDict["TYPE"] == "PYTHON_CODE":
             pythonCode = messageDict["PAYLOAD"]["pythonCode"]
-            if not self.isPaused:
-                self.pause()
-                time.sleep(0.5)  # Give coroutines a chance to pause.
-            result = None
-            print(f"Evaluating `{pythonCode}`...")
-            try:
-                result = repr(eval(pythonCode))
-                print("Completed.")
-            except SyntaxError:
-                print(f"Got SyntaxError, so trying `exec('{pythonCode}')`")
-                try:
-                    exec(pythonCode)
-                    print("Completed.")
-                except:
-                    result = traceback.format_exc()
-                    print("Errored.")
-            except:
-                result = traceback.format_exc()
-                print("Errored.")
+            mode = messageDict["PAYLOAD"].get("mode", wire_format.INSPECTION_MODES[0])
+            if mode not in wire_format.INSPECTION_MODES:
+                result = f"Unknown mode: {mode} (one of {wire_format.INSPECTION_MODES})"
+            elif mode == "snapshot":
+                result = evaluatePythonCode(
+                    pythonCode,
+                    {"self": self.makeInspectionSnapshot()},
+                    globalVars={"np": np},
+                    maxResultLength=MAX_SNAPSHOT_RESULT_LENGTH,
+                )
+            else:
+                # No need to wait for the loops to pause, since none of them runs
+                # until the code is done anyway, and each stops at its next iteration.
+                # But a training already running in the worker thread would still swap
+                # in its model, so wait for it.
+                if mode == "pause":
+                    if not self.isPaused:
+                        self.pause()
+                    await self.waitForTraining()
+                result = evaluatePythonCode(pythonCode, {"self": self})
             msgDict = {"TYPE": "RESULT_OF_EVAL", "PAYLOAD": {"result": result}}
             msg = json.dumps(msgDict)
             await websocket.send(msg)
 
+        if messageDict["TYPE"] == "GET_METRICS":
+            metrics = self.metrics.summary() if self.metrics is not None else None
+            msgDict = {"TYPE": "METRICS", "PAYLOAD": {"metrics": metrics}}
+            msg = json.dumps(msgDict)
+            await websocket.send(msg)
+
         # If paused, don't handle any messages, except the PYTHON_CODE message, so that
         # it is still possible to unpause things.
         if self.isPaused:
             return
 
         if messageDict["TYPE"] == "GAME_UPDATE":
-            gameState = messageDict["PAYLOAD"]["gameState"]
-            self.gameState = gameState
-            self.gameWebSocket = websocket
+            receivedAt = time.perf_counter() if self.metrics is not None else None
+            self.handleGameUpdate(messageDict, websocket, receivedAt)
+
+    def handlePendingGameUpdate(self):
+        """Parse and handle the latest GAME_UPDATE message received, if it hasn't been
+        handled yet.
+        """
+        if self.pendingGameUpdate is None:
+            return
+        message, websocket, receivedAt = self.pendingGameUpdate
+        self.pendingGameUpdate = None
+        messageDict = wire_format.decodeMessage(message)
+        self.handleGameUpdate(messageDict, websocket, receivedAt)
+
+    def handleGameUpdate(self, messageDict, websocket, receivedAt):
+        """Store the game state from a GAME_UPDATE message.
+
+        :param dict messageDict: the parsed GAME_UPDATE message
+        :param websockets.WebSocketServerProtocol websocket: connection it came on
+        :param float|None receivedAt: time.perf_counter() when it arrived (if doing
+            metrics)
+        """
+        gameState = messageDict["PAYLOAD"]["gameState"]
+        self.gameState = gameState
+        self.gameStateReceivedAt = receivedAt
+        self.gameWebSocket = websocket
+
+    def makeVisualizer(self, channels, windowLength):
+        """Start charting the measurements in real time.
+
+        :param list[int]|None channels: which channels to chart, or None for the
+            direction-tuned ones
+        :param int windowLength: how many of the latest measurements to chart
 
-    def initializeVisualization(self):
-        """Create the figures used for real-time visualizations."""
+        :return Visualizer:
+        """
+        tunedDirections = {
+            channelIdx: direction
+            for direction, channelIdx in self.directionTunedIndices.items()
+        }
+        if channels is None:
+            channels = list(tunedDirections)
+        channelLabels = []
+        for channelIdx in channels:
+            label = f"Channel {channelIdx}"
+            if channelIdx in tunedDirections:
+                label += f" (tuned to '{tunedDirections[channelIdx]}')"
+            channelLabels.append(label)
         yMin = self.restingMeansRange[0] - (self.restingStdDevsRange[1] * 3)
-        yMax = self.restingMeansRange[1] + (self.restingStdDevsRange[1] * 3)
-        self.fig.suptitle("Recent Measurements")
-        idx = 0
-        for direction, channelIdx in self.directionTunedIndices.items():
-            self.axs[idx].set_title(f"Channel {channelIdx} (tuned to '{direction}')")
-            self.axs[idx].set_xlim((0, self.lengthOfRecentMeasurements))
-            self.axs[idx].set_ylim((yMin, yMax))
-            (line,) = self.axs[idx].plot([])
-            self.lines[direction] = line
-            idx += 1
-        plt.tight_layout()  # auto-adjust margins between subplots
-        plt.ion()  # allow updating data in real-time
-        plt.show()
-
-    async def visualizationLoop(self):
-        """Display and update charts to visualize various data in real time."""
-        visualizationInterval = 1
-        while True:
-            await self.loopWhilePaused()
-            for direction, channelIdx in self.directionTunedIndices.items():
-                line = self.lines[direction]
-                # Values on the same channel over time.
-                values = self.recentMeasurements[:, channelIdx]
-                # Send the update with the most recent data
-                line.set_xdata(range(len(self.recentMeasurements)))
-                line.set_ydata(values)
-            plt.pause(0.01)
-            await asyncio.sleep(visualizationInterval)
+        yMax = (
+            self.restingMeansRange[1]
+            + self.directionTunedMeanShift
+            + (self.restingStdDevsRange[1] * 3)
+        )
+        return Visualizer(
+            channels,
+            channelLabels=channelLabels,
+            windowLength=windowLength,
+            yLimits=(yMin, yMax),
+        )
 
     async def loggingLoop(self):
         """Log measurements, game state, etc. to files."""
@@ -357,22 +835,84 @@ class Player:
         while True:
             await self.loopWhilePaused()
             if self.currentMeasurements is not None and self.gameState is not None:
-                timestring = datetime.now(tz=timezone.utc).isoformat()
-                playerId = self.playerId
-                measurements = self.currentMeasurements.tolist()
-                gameState = self.gameState
-                direction = self.getDirectionFromGameState(self.gameState)
-                logDict = {
-                    "timestring": timestring,
-                    "playerId": playerId,
-                    "measurements": measurements,
-                    "gameState": gameState,
-                    "direction": direction,
-                }
-                logLine = f"{json.dumps(logDict)}\n"
-                self.logFile.write(logLine)
+                self.writeLogLine()
             await asyncio.sleep(loggingInterval)
 
+    def writeLogLine(self):
+        """Write the current measurements, game state, etc. to the log file, as a line
+        of JSON.
+        """
+        timestring = datetime.now(tz=timezone.utc).isoformat()
+        playerId = self.playerId
+        measurements = self.currentMeasurements.tolist()
+        gameState = self.gameState
+        direction = self.getDirectionFromGameState(self.gameState)
+        logDict = {
+            "timestring": timestring,
+            "playerId": playerId,
+            "measurements": measurements,
+            "gameState": gameState,
+            "direction": direction,
+        }
+        logLine = f"{json.dumps(logDict)}\n"
+        self.logFile.write(logLine)
+
+
+def evaluatePythonCode(pythonCode, localVars, globalVars=None, maxResultLength=None):
+    """Evaluate Python code sent by the inspector, as an expression if it is one, or
+    else as statements.
+
+    :param str pythonCode:
+    :param dict localVars: variables the code can refer to (e.g. "self")
+    :param dict|None globalVars: global variables of the code, or None for this
+        module's (which the code can then change)
+    :param int|None maxResultLength: if given, make the result compact (see
+        compactRepr), at most about this many characters
+
+    :return str|None result: repr of the expression's value, the traceback if there was
+        an exception, or None for statements that ran fine
+    """
+    if globalVars is None:
+        globalVars = globals()
+    result = None
+    print(f"Evaluating `{pythonCode}`...")
+    try:
+        value = eval(pythonCode, globalVars, localVars)
+        if maxResultLength is None:
+            result = repr(value)
+        else:
+            result = compactRepr(value, maxResultLength)
+        print("Completed.")
+    except SyntaxError:
+        print(f"Got SyntaxError, so trying `exec('{pythonCode}')`")
+        try:
+            exec(pythonCode, globalVars, localVars)
+            print("Completed.")
+        except:
+            result = traceback.format_exc()
+            print("Errored.")
+    except:
+        result = traceback.format_exc()
+        print("Errored.")
+    return result
+
+
+def compactRepr(value, maxLength):
+    """repr of a value, kept short: numpy arrays in it are summarized (with just their
+    first and last few values once large), and what's still too long is cut off.
+
+    :param value:
+    :param int maxLength: most characters to keep
+
+    :return str result:
+    """
+    with np.printoptions(threshold=100, edgeitems=3, precision=4):
+        result = repr(value)
+    if len(result) > maxLength:
+        numCut = len(result) - maxLength
+        result = f"{result[:maxLength]}... ({numCut} more characters)"
+    return result
+
 
 def main():
     player = Player(
@@ -0,0 +1,65 @@
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-length history of samples, which forgets the oldest sample when a new one
+    is added to a full history.
+
+    Each sample is written twice, at its slot and at its slot plus the length, so the
+    history in order (oldest first) is always one contiguous slice of the backing array.
+    That makes adding a sample O(sample size) and getting the ordered history a view
+    (not a copy), no matter how long the history is.
+    """
+
+    def __init__(self, length, sampleShape, dtype=np.float64):
+        """
+        :param int length: how many samples to remember
+        :param tuple[int] sampleShape: shape of each sample (e.g. (192,))
+        :param dtype: numpy dtype of the samples
+        """
+        self.length = length
+        self.sampleShape = tuple(sampleShape)
+        self._data = np.zeros((2 * self.length, *self.sampleShape), dtype=dtype)
+        # Slot the next sample will be written to.
+        self._nextSlot = 0
+        # How many samples are currently remembered.
+        self.size = 0
+        # How many samples have ever been added.
+        self.numAppended = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, sample):
+        """Add a sample, forgetting the oldest one if already full.
+
+        :param np.array sample: array of shape self.sampleShape
+        """
+        self._data[self._nextSlot] = sample
+        self._data[self._nextSlot + self.length] = sample
+        self._nextSlot = (self._nextSlot + 1) % self.length
+        if self.size < self.length:
+            self.size += 1
+        self.numAppended += 1
+
+    def view(self):
+        """Get the remembered samples, oldest first.
+
+        This is a view into the buffer, so it changes as samples are added. Copy it to
+        keep it.
+
+        :return np.array: shape (self.size, *self.sampleShape)
+        """
+        end = self._nextSlot + self.length
+        return self._data[end - self.size : end]
+
+    def latest(self):
+        """Get the most recently added sample (a view), or None if there is none yet."""
+        if self.size == 0:
+            return None
+        return self._data[self._nextSlot + self.length - 1]
+
+    def clear(self):
+        """Forget all samples."""
+        self._nextSlot = 0
+        self.size = 0
@@ -0,0 +1,346 @@
+import json
+import asyncio
+import argparse
+import concurrent.futures
+import time
+from collections import namedtuple
+
+import websockets
+import numpy as np
+
+from channel_selection import SELECTION_METHODS
+from constants import HOST, PORT
+from metrics import Metrics
+from player import MAX_SNAPSHOT_RESULT_LENGTH, Player, evaluatePythonCode
+import wire_format
+
+
+# What of a PlayerServer's state can be inspected without pausing it (see
+# PlayerServer.makeInspectionSnapshot).
+#   isPaused, maxSessions: as on the PlayerServer
+#   sessions: a PlayerSnapshot of each session, by playerId
+ServerSnapshot = namedtuple("ServerSnapshot", ["isPaused", "maxSessions", "sessions"])
+
+
+class PlayerServer:
+    """WebSocket server hosting a separate Player session for each game connected to
+    it.
+
+    Each game connection gets its own isolated Player (its own simulated subject,
+    decoder, history of measurements, and playerId), created when the first GAME_UPDATE
+    arrives on that connection, and evicted when the connection closes. Connections
+    that don't send GAME_UPDATE messages (e.g. from the inspector) don't get a session.
+
+    All sessions share one event loop and one pool of worker threads in which their
+    decoders are trained.
+    """
+
+    def __init__(
+        self,
+        wsHost,
+        wsPort,
+        maxSessions=32,
+        numTrainingWorkers=4,
+        maxTrainingSamples=100000,
+        lengthOfRecentMeasurements=30,
+        featureWindowLength=5,
+        decoderMode="batch",
+        inputSelectionMethod=None,
+        numSelectedInputs=16,
+        doLogging=False,
+        loggingBackend="binary",
+        doMetrics=False,
+    ):
+        """
+        :param str wsHost: ip address where the ws server can be reached
+        :param int wsPort: port where the ws server can be reached
+        :param int maxSessions: most sessions to host at once (more game connections
+            are turned away)
+        :param int numTrainingWorkers: how many worker threads the sessions' decoders
+            are trained in
+        :param int|None maxTrainingSamples: most training samples each session's
+            decoder keeps, or None to keep all of them
+        :param int lengthOfRecentMeasurements: how many steps of recent measurements
+            each session remembers
+        :param int featureWindowLength: how many recent measurements each session's
+            decoder's window features are over (see Player)
+        :param str decoderMode: "batch", "online", or "kalman" (see Decoder)
+        :param str|None inputSelectionMethod: how each session's decoder picks the
+            features to train on, or None to use all of them (see Player)
+        :param int numSelectedInputs: how many features each session's decoder picks
+        :param bool doLogging: whether each session logs its run
+        :param str loggingBackend: "binary" or "json" (see Player). Prefer "binary",
+            whose log files are per run, so sessions don't share a file
+        :param bool doMetrics: whether each session keeps latency metrics (and the
+            server keeps metrics of the event loop they share)
+        """
+        self.wsHost = wsHost
+        self.wsPort = wsPort
+        self.maxSessions = maxSessions
+        # Worker threads shared by all sessions for training their decoders. Each
+        # session still only trains one model at a time.
+        self.trainingExecutor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=numTrainingWorkers
+        )
+        # Keyword arguments for the Player of each session.
+        self.sessionKwargs = {
+            "doVisualization": False,
+            "doLogging": doLogging,
+            "decoderMode": decoderMode,
+            "inputSelectionMethod": inputSelectionMethod,
+            "numSelectedInputs": numSelectedInputs,
+            "lengthOfRecentMeasurements": lengthOfRecentMeasurements,
+            "featureWindowLength": featureWindowLength,
+            "loggingBackend": loggingBackend,
+            "doMetrics": doMetrics,
+            "maxTrainingSamples": maxTrainingSamples,
+            "trainingExecutor": self.trainingExecutor,
+        }
+        # Current sessions, by playerId, and the task running each one's loops.
+        self.sessions = {}
+        self.sessionTasks = {}
+
+        self.isPaused = False
+        self.metrics = Metrics() if doMetrics else None
+
+    async def start(self):
+        """Start the WebSocket server, and keep running until cancelled."""
+        tasks = [
+            # Task for listening for WebSocket connections and messages.
+            websockets.serve(
+                self.connectionHandler,
+                self.wsHost,
+                self.wsPort,
+                subprotocols=wire_format.SUBPROTOCOLS,
+            ),
+        ]
+        # Task for measuring event loop lag.
+        if self.metrics is not None:
+            tasks.append(asyncio.create_task(self.eventLoopLagLoop()))
+        await asyncio.gather(*tasks)
+        # The WebSocket server keeps serving in the background once started, so wait
+        # until cancelled (without metrics, nothing else keeps this running).
+        await asyncio.Future()
+
+    def tearDown(self):
+        """Clean up all sessions for the end of the program."""
+        for sessionTask in self.sessionTasks.values():
+            sessionTask.cancel()
+        # Drop the trainings not started yet, and wait for the running ones here,
+        # rather than at interpreter exit, where waiting can't be interrupted cleanly
+        # (and so that sessions saving their decoders save the latest models).
+        print("Waiting for running trainings to finish...")
+        try:
+            self.trainingExecutor.shutdown(wait=True, cancel_futures=True)
+        except KeyboardInterrupt:
+            # Still clean up the sessions (e.g. write out their logs).
+            print("Not waiting for running trainings.")
+        for playerId in list(self.sessions):
+            self.sessionTasks.pop(playerId)
+            self.sessions.pop(playerId).tearDown()
+
+    def openSession(self, websocket):
+        """Start a session for a game connection, if there is room for it.
+
+        :param websockets.WebSocketServerProtocol websocket:
+
+        :return Player|None session: None if already hosting maxSessions sessions
+        """
+        if len(self.sessions) >= self.maxSessions:
+            return None
+        session = Player(self.wsHost, self.wsPort, **self.sessionKwargs)
+        if self.isPaused:
+            session.pause()
+        session.gameWebSocket = websocket
+        self.sessions[session.playerId] = session
+        self.sessionTasks[session.playerId] = asyncio.create_task(session.runLoops())
+        print(f"Opened session {session.playerId} ({len(self.sessions)} sessions).")
+        return session
+
+    async def closeSession(self, session):
+        """Stop a session's loops and clean it up.
+
+        :param Player session:
+        """
+        task = self.sessionTasks.pop(session.playerId)
+        del self.sessions[session.playerId]
+        numSessions = len(self.sessions)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        # Closing the session's log waits for its last writes, so don't do it on the
+        # event loop.
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, session.tearDown)
+        print(f"Closed session {session.playerId} ({numSessions} sessions).")
+
+    async def connectionHandler(self, websocket, path):
+        """Called once per connection to the WebSocket server. Hand the connection's
+        game updates to its session (opening it on the first one), and handle other
+        messages here.
+
+        Signature set by `websockets` library, specifically the `serve` method.
+
+        :param websockets.WebSocketServerProtocol websocket:
+        :param str path:
+        """
+        _ = path
+        print(f"WebSocket connection open (subprotocol: {websocket.subprotocol}).")
+        session = None
+        try:
+            async for message in websocket:
+                isGameUpdate = wire_format.isGameUpdate(message)
+                messageDict = None
+                if not isGameUpdate:
+                    messageDict = wire_format.decodeMessage(message)
+                    isGameUpdate = messageDict["TYPE"] == "GAME_UPDATE"
+                if not isGameUpdate:
+                    await self.messageHandler(messageDict, websocket)
+                    continue
+                if session is None:
+                    session = self.openSession(websocket)
+                    if session is None:
+                        # 1013 is "Try Again Later".
+                        await websocket.close(1013, "Too many sessions.")
+                        break
+                if messageDict is None:
+                    session.receiveGameUpdate(message, websocket)
+                else:
+                    await session.messageHandler(messageDict, websocket)
+        finally:
+            if session is not None:
+                await self.closeSession(session)
+        print("WebSocket connection closed.")
+
+    async def messageHandler(self, messageDict, websocket):
+        """Called once per incoming WebSocket message other than GAME_UPDATE.
+
+        :param dict messageDict: Keys "TYPE" and "PAYLOAD". More details on the API
+            found in `player/README.md`.
+        :param websockets.WebSocketServerProtocol websocket:
+        """
+        if messageDict["TYPE"] == "PYTHON_CODE":
+            pythonCode = messageDict["PAYLOAD"]["pythonCode"]
+            mode = messageDict["PAYLOAD"].get("mode", wire_format.INSPECTION_MODES[0])
+            if mode not in wire_format.INSPECTION_MODES:
+                result = f"Unknown mode: {mode} (one of {wire_format.INSPECTION_MODES})"
+            elif mode == "snapshot":
+                result = evaluatePythonCode(
+                    pythonCode,
+                    {"self": self.makeInspectionSnapshot()},
+                    globalVars={"np": np},
+                    maxResultLength=MAX_SNAPSHOT_RESULT_LENGTH,
+                )
+            else:
+                if mode == "pause":
+                    if not self.isPaused:
+                        self.pause()
+                    # See Player.messageHandler.
+                    await asyncio.gather(
+                        *(
+                            session.waitForTraining()
+                            for session in self.sessions.values()
+                        )
+                    )
+                result = evaluatePythonCode(pythonCode, {"self": self})
+            msgDict = {"TYPE": "RESULT_OF_EVAL", "PAYLOAD": {"result": result}}
+            msg = json.dumps(msgDict)
+            await websocket.send(msg)
+
+        if messageDict["TYPE"] == "GET_METRICS":
+            metrics = None
+            if self.metrics is not None:
+                metrics = self.metrics.summary()
+                metrics["sessions"] = {
+                    playerId: session.metrics.summary()
+                    for playerId, session in self.sessions.items()
+                }
+            msgDict = {"TYPE": "METRICS", "PAYLOAD": {"metrics": metrics}}
+            msg = json.dumps(msgDict)
+            await websocket.send(msg)
+
+    def makeInspectionSnapshot(self):
+        """Capture the state of the server and its sessions worth inspecting (see
+        Player.makeInspectionSnapshot).
+
+        :return ServerSnapshot:
+        """
+        return ServerSnapshot(
+            isPaused=self.isPaused,
+            maxSessions=self.maxSessions,
+            sessions={
+                playerId: session.makeInspectionSnapshot()
+                for playerId, session in self.sessions.items()
+            },
+        )
+
+    def pause(self):
+        """Pause the loops of all sessions (including ones opened while paused)."""
+        self.isPaused = True
+        for session in self.sessions.values():
+            session.pause()
+
+    def unpause(self):
+        """Unpause the loops of all sessions."""
+        self.isPaused = False
+        for session in self.sessions.values():
+            session.unpause()
+
+    async def eventLoopLagLoop(self):
+        """Repeatedly measure how much later than asked for a sleep wakes up, which is
+        how long something else (e.g. any session) blocked the event loop.
+        """
+        lagInterval = 0.05
+        while True:
+            startTime = time.perf_counter()
+            await asyncio.sleep(lagInterval)
+            lag = time.perf_counter() - startTime - lagInterval
+            self.metrics.record("eventLoopLag", lag)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Host a separate player session for each connected game."
+    )
+    parser.add_argument("--max-sessions", type=int, default=32)
+    parser.add_argument("--training-workers", type=int, default=4)
+    parser.add_argument("--max-training-samples", type=int, default=100000)
+    parser.add_argument(
+        "--decoder-mode", choices=["batch", "online", "kalman"], default="batch"
+    )
+    parser.add_argument(
+        "--selection-method",
+        choices=SELECTION_METHODS,
+        default=None,
+        help="train each decoder on only the features picked this way",
+    )
+    parser.add_argument("--selected-inputs", type=int, default=16)
+    parser.add_argument("--metrics", action="store_true")
+    args = parser.parse_args()
+
+    server = PlayerServer(
+        HOST,
+        PORT,
+        maxSessions=args.max_sessions,
+        numTrainingWorkers=args.training_workers,
+        maxTrainingSamples=args.max_training_samples,
+        decoderMode=args.decoder_mode,
+        inputSelectionMethod=args.selection_method,
+        numSelectedInputs=args.selected_inputs,
+        doLogging=True,
+        loggingBackend="binary",
+        doMetrics=args.metrics,
+    )
+
+    try:
+        print("Starting player server...")
+        asyncio.run(server.start())
+    except KeyboardInterrupt:
+        print("\nReceived keyboard interrupt...")
+        server.tearDown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import os
+import json
+import concurrent.futures
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+
+from training_data import DIRECTION_CODES
+
+
+# Layout of the per-sample record stored alongside each row of measurements.
+SAMPLE_DTYPE = np.dtype(
+    [
+        ("timestamp", "<f8"),  # seconds since the Unix epoch
+        ("cursorX", "<f4"),
+        ("cursorY", "<f4"),
+        ("targetX", "<f4"),
+        ("targetY", "<f4"),
+        ("direction", "i1"),  # integer code, see training_data.DIRECTION_CODES
+        ("isCalibrating", "?"),
+    ]
+)
+MEASUREMENTS_DTYPE = np.dtype("<f4")
+
+MEASUREMENTS_FILE_NAME = "measurements.f32"
+SAMPLES_FILE_NAME = "samples.bin"
+META_FILE_NAME = "meta.json"
+# Index of all the runs logged in a folder (shared by all the runs' folders in it).
+INDEX_FILE_NAME = "index.jsonl"
+
+# Where to find a run's samples.
+#   playerId: ID of the run
+#   runDirPath: folder of the run's log files
+#   numChannels: how many measurements per sample
+#   numRows: how many samples have been written
+#   calibrationRanges: list of [start, end) row ranges during which the game was
+#       calibrating
+RunIndex = namedtuple(
+    "RunIndex",
+    ["playerId", "runDirPath", "numChannels", "numRows", "calibrationRanges"],
+)
+
+# A run's logged samples.
+#   measurements: (numSamples, numChannels) float32 array
+#   samples: (numSamples,) array of SAMPLE_DTYPE records
+#   directionCodes: (numSamples,) integer codes of the direction the cursor needed
+#       to go
+RunData = namedtuple("RunData", ["measurements", "samples", "directionCodes"])
+
+
+class BinarySessionLog:
+    """Append-only binary log of every sample of one run of the player.
+
+    A run's log is a folder (named by playerId) holding:
+    - measurements.f32: the measurements, as raw float32 rows of numChannels values
+    - samples.bin: for each row of measurements, a raw record of SAMPLE_DTYPE with the
+        time, game state, and direction
+    - meta.json: small sidecar describing the above (playerId, numChannels, dtypes)
+
+    Samples are buffered in memory and written in chunks by a worker thread, so
+    appending a sample never waits on the disk. After each chunk is written, a line
+    describing it (which run, which rows, which of those were calibrating) is appended
+    to the index file of the folder the run's folder is in, so runs can be found and
+    loaded without scanning the data (see readLogIndex and loadRun).
+    """
+
+    def __init__(self, logDirPath, playerId, numChannels, bufferLength=1000):
+        """
+        :param str logDirPath: folder in which to put this run's folder
+        :param str playerId: ID of the run
+        :param int numChannels: how many measurements per sample
+        :param int bufferLength: how many samples to buffer before writing them out
+        """
+        self.playerId = playerId
+        self.numChannels = numChannels
+        self.bufferLength = bufferLength
+        self.runDirPath = os.path.join(logDirPath, playerId)
+        os.makedirs(self.runDirPath, exist_ok=True)
+        self.indexFilePath = os.path.join(logDirPath, INDEX_FILE_NAME)
+        # How many samples have been handed to the worker thread to write.
+        self.numRowsFlushed = 0
+
+        meta = {
+            "playerId": self.playerId,
+            "numChannels": self.numChannels,
+            "measurementsDtype": MEASUREMENTS_DTYPE.str,
+            "sampleDtype": SAMPLE_DTYPE.descr,
+            "timestring": datetime.now(tz=timezone.utc).isoformat(),
+        }
+        with open(os.path.join(self.runDirPath, META_FILE_NAME), "w") as f:
+            json.dump(meta, f)
+        self.measurementsFile = open(
+            os.path.join(self.runDirPath, MEASUREMENTS_FILE_NAME), "ab"
+        )
+        self.samplesFile = open(os.path.join(self.runDirPath, SAMPLES_FILE_NAME), "ab")
+
+        self._newBuffers()
+        # Single worker thread doing the writes, so chunks are written in order.
+        self.writeExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def _newBuffers(self):
+        """Start filling fresh buffers (the old ones may still be being written)."""
+        self._measurements = np.empty(
+            (self.bufferLength, self.numChannels), dtype=MEASUREMENTS_DTYPE
+        )
+        self._samples = np.empty(self.bufferLength, dtype=SAMPLE_DTYPE)
+        self._numBuffered = 0
+
+    def append(self, measurements, gameState, direction, timestamp):
+        """Log one sample.
+
+        :param np.array measurements: shape (numChannels,)
+        :param dict gameState: see game/README.md
+        :param str direction: "up", "right", "down", or "left"
+        :param float timestamp: seconds since the Unix epoch
+        """
+        idx = self._numBuffered
+        self._measurements[idx] = measurements
+        playerCursor = gameState["playerCursor"]
+        target = gameState["target"]
+        self._samples[idx] = (
+            timestamp,
+            playerCursor["x"],
+            playerCursor["y"],
+            target["x"],
+            target["y"],
+            DIRECTION_CODES[direction],
+            gameState["isCalibrating"],
+        )
+        self._numBuffered += 1
+        if self._numBuffered == self.bufferLength:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered samples to the worker thread to be written out.
+
+        :return concurrent.futures.Future|None: done once the samples are written
+        """
+        numBuffered = self._numBuffered
+        if numBuffered == 0:
+            return None
+        measurements = self._measurements[:numBuffered]
+        samples = self._samples[:numBuffered]
+        rowStart = self.numRowsFlushed
+        self.numRowsFlushed += numBuffered
+        self._newBuffers()
+        return self.writeExecutor.submit(self._write, measurements, samples, rowStart)
+
+    def _write(self, measurements, samples, rowStart):
+        """Append a chunk of samples to the files, then index it (in the worker
+        thread).
+        """
+        measurements.tofile(self.measurementsFile)
+        samples.tofile(self.samplesFile)
+        self.measurementsFile.flush()
+        self.samplesFile.flush()
+
+        # Find the ranges of rows during which the game was calibrating, from where
+        # isCalibrating switches on to where it switches off.
+        isCalibrating = np.concatenate(([False], samples["isCalibrating"], [False]))
+        switches = np.flatnonzero(isCalibrating[1:] != isCalibrating[:-1]) + rowStart
+        calibrationRanges = switches.reshape((-1, 2)).tolist()
+        indexEntry = {
+            "playerId": self.playerId,
+            "runDirPath": os.path.basename(self.runDirPath),
+            "numChannels": self.numChannels,
+            "rowStart": rowStart,
+            "numRows": len(samples),
+            "calibrationRanges": calibrationRanges,
+        }
+        # One write per line, in append mode, so runs logging to the same folder at
+        # the same time don't garble each other's lines.
+        with open(self.indexFilePath, "a") as f:
+            f.write(f"{json.dumps(indexEntry)}\n")
+
+    def close(self):
+        """Write out anything buffered, and close the files."""
+        self.flush()
+        self.writeExecutor.shutdown(wait=True)
+        self.measurementsFile.close()
+        self.samplesFile.close()
+
+
+def readLogIndex(logDirPath):
+    """Read the index of the runs logged in a folder.
+
+    :param str logDirPath: folder that BinarySessionLog was given
+
+    :return dict[str, RunIndex] runIndexes: by playerId, in the order the runs were
+        first logged (so the last one is the latest run)
+    """
+    runIndexes = {}
+    indexFilePath = os.path.join(logDirPath, INDEX_FILE_NAME)
+    with open(indexFilePath, "r") as f:
+        for line in f:
+            indexEntry = json.loads(line)
+            playerId = indexEntry["playerId"]
+            runIndex = runIndexes.get(playerId)
+            if runIndex is None:
+                runIndex = RunIndex(
+                    playerId=playerId,
+                    runDirPath=os.path.join(logDirPath, indexEntry["runDirPath"]),
+                    numChannels=indexEntry["numChannels"],
+                    numRows=0,
+                    calibrationRanges=[],
+                )
+            calibrationRanges = runIndex.calibrationRanges
+            for start, end in indexEntry["calibrationRanges"]:
+                # Merge with the previous range if it continues across chunks.
+                if calibrationRanges and calibrationRanges[-1][1] == start:
+                    calibrationRanges[-1][1] = end
+                else:
+                    calibrationRanges.append([start, end])
+            numRows = indexEntry["rowStart"] + indexEntry["numRows"]
+            runIndexes[playerId] = runIndex._replace(
+                numRows=max(runIndex.numRows, numRows)
+            )
+    return runIndexes
+
+
+def loadRun(runIndex, onlyCalibrating=False):
+    """Load a run's logged samples.
+
+    The log files are memory-mapped, so only the samples asked for are read from disk.
+
+    :param RunIndex runIndex: from readLogIndex
+    :param bool onlyCalibrating: whether to only load the samples taken while the game
+        was calibrating
+
+    :return RunData:
+    """
+    if runIndex.numRows == 0:
+        # Nothing to map (and an empty file can't be memory-mapped).
+        samples = np.empty(0, dtype=SAMPLE_DTYPE)
+        measurements = np.empty((0, runIndex.numChannels), dtype=MEASUREMENTS_DTYPE)
+        return RunData(measurements, samples, samples["direction"])
+    measurements = np.memmap(
+        os.path.join(runIndex.runDirPath, MEASUREMENTS_FILE_NAME),
+        dtype=MEASUREMENTS_DTYPE,
+        mode="r",
+        shape=(runIndex.numRows, runIndex.numChannels),
+    )
+    samples = np.memmap(
+        os.path.join(runIndex.runDirPath, SAMPLES_FILE_NAME),
+        dtype=SAMPLE_DTYPE,
+        mode="r",
+        shape=(runIndex.numRows,),
+    )
+    if onlyCalibrating:
+        ranges = runIndex.calibrationRanges
+        if len(ranges) == 1:
+            ((start, end),) = ranges
+            measurements, samples = measurements[start:end], samples[start:end]
+        else:
+            rows = np.concatenate(
+                [np.arange(start, end) for start, end in ranges] or [[]]
+            ).astype(np.intp)
+            measurements, samples = measurements[rows], samples[rows]
+    return RunData(measurements, samples, samples["direction"])
+
+
+def getRunStartTime(runIndex):
+    """When a run started logging.
+
+    :param RunIndex runIndex: from readLogIndex
+
+    :return datetime:
+    """
+    with open(os.path.join(runIndex.runDirPath, META_FILE_NAME), "r") as f:
+        meta = json.load(f)
+    return datetime.fromisoformat(meta["timestring"])
@@ -0,0 +1,288 @@
+import argparse
+import time
+
+import numpy as np
+
+from channel_selection import SELECTION_METHODS
+from decoder import Decoder, DIRECTION_VELOCITIES
+from misc_helpers import shiftSamples
+from training_data import DIRECTIONS
+
+
+class SimulatedPlayers:
+    """Batch of fake players, whose measurements are all generated at once.
+
+    Each simulated player works like the one in Player (resting mean and standard
+    deviation per channel, plus one channel tuned to each cursor direction whose mean
+    shifts when the cursor needs to go that direction), but measurements for many
+    players over many ticks are generated in one pass instead of one tick at a time.
+    """
+
+    def __init__(
+        self,
+        numPlayers,
+        numChannels=192,
+        restingMeansRange=(5, 25),
+        restingStdDevsRange=(0.1, 0.3),
+        directionTunedMeanShift=4,
+        randGenerator=None,
+    ):
+        """
+        :param int numPlayers: how many players to simulate
+        :param int numChannels: how many channels each player has
+        :param (float, float) restingMeansRange: range of each channel's resting mean
+        :param (float, float) restingStdDevsRange: range of each channel's standard
+            deviation
+        :param float directionTunedMeanShift: how much a direction-tuned channel's mean
+            changes when the cursor needs to go in its direction
+        :param np.random.Generator|None randGenerator: generator of randomness
+        """
+        self.numPlayers = numPlayers
+        self.numChannels = numChannels
+        self.directionTunedMeanShift = directionTunedMeanShift
+        self.randGenerator = randGenerator or np.random.default_rng()
+
+        shape = (self.numPlayers, self.numChannels)
+        # Mean value of each player's channels when no input from game.
+        self.restingMeans = shiftSamples(
+            self.randGenerator.random(shape), restingMeansRange
+        )
+        # Standard deviation of each player's channels.
+        self.restingStdDevs = shiftSamples(
+            self.randGenerator.random(shape), restingStdDevsRange
+        )
+        # For each player, the channel tuned to each direction (columns in the order of
+        # training_data.DIRECTIONS). The 4 channels of a player are all different.
+        self.directionTunedIndices = self.randGenerator.random(shape).argpartition(
+            len(DIRECTIONS), axis=1
+        )[:, : len(DIRECTIONS)]
+
+    def randomDirectionCodes(self, numTicks, meanRunLength=1):
+        """Pick a random direction for each player to need to go at each tick.
+
+        :param int numTicks:
+        :param float meanRunLength: average number of ticks in a row that a direction
+            is kept for (1 picks a new direction every tick, larger values are more
+            like a cursor heading for a target)
+
+        :return np.array directionCodes: shape (numPlayers, numTicks), integer codes of
+            directions (see training_data.DIRECTION_CODES)
+        """
+        shape = (self.numPlayers, numTicks)
+        directionCodes = self.randGenerator.integers(
+            len(DIRECTIONS), size=shape, dtype=np.int8
+        )
+        if meanRunLength <= 1:
+            return directionCodes
+        # Only pick a new direction at random ticks (always including the first), and
+        # carry it forward until the next pick.
+        isPick = self.randGenerator.random(shape) < 1 / meanRunLength
+        isPick[:, 0] = True
+        pickIdxs = np.where(isPick, np.arange(numTicks), 0)
+        np.maximum.accumulate(pickIdxs, axis=1, out=pickIdxs)
+        return np.take_along_axis(directionCodes, pickIdxs, axis=1)
+
+    def measure(self, directionCodes):
+        """Generate measurements of every player at every tick.
+
+        :param np.array directionCodes: shape (numPlayers, numTicks), integer code of
+            the direction each player's cursor needs to go at each tick
+
+        :return np.array measurements: shape (numPlayers, numTicks, numChannels)
+        """
+        numTicks = directionCodes.shape[1]
+        measurements = self.randGenerator.standard_normal(
+            (self.numPlayers, numTicks, self.numChannels)
+        )
+        measurements *= self.restingStdDevs[:, np.newaxis, :]
+        measurements += self.restingMeans[:, np.newaxis, :]
+        # Keep values non-negative, as if they were counting something.
+        np.clip(measurements, 0, None, out=measurements)
+        # Shift the mean of the channel tuned to each tick's direction. (Player instead
+        # resamples that channel with the shifted mean, which is the same distribution.)
+        tunedChannels = np.take_along_axis(
+            self.directionTunedIndices, directionCodes.astype(np.intp), axis=1
+        )
+        playerIdxs = np.arange(self.numPlayers)[:, np.newaxis]
+        tickIdxs = np.arange(numTicks)[np.newaxis, :]
+        shift = self.directionTunedMeanShift
+        measurements[playerIdxs, tickIdxs, tunedChannels] += shift
+        return measurements
+
+
+def benchmarkDecoders(
+    numPlayers,
+    numCalibrationTicks,
+    numTestTicks,
+    numChannels=192,
+    decoderMode="batch",
+    meanRunLength=1,
+    randSeed=None,
+    selectionMethod=None,
+    numSelectedInputs=16,
+):
+    """Simulate many players, train a Decoder per player, and time training and
+    decoding.
+
+    :param int numPlayers: how many players (and thus decoders)
+    :param int numCalibrationTicks: how many ticks of training data per player
+    :param int numTestTicks: how many ticks to decode per player
+    :param int numChannels: how many channels each player has
+    :param str decoderMode: "batch", "online", or "kalman" (see Decoder)
+    :param float meanRunLength: average number of ticks in a row each player needs to
+        go the same direction (see SimulatedPlayers.randomDirectionCodes)
+    :param int|None randSeed: seed of the simulation, so different decoder modes can
+        be compared on the same simulated players
+    :param str|None selectionMethod: how each decoder picks the channels to train on,
+        or None to use all of them (see Decoder)
+    :param int numSelectedInputs: how many channels each decoder picks
+
+    :return dict results: timings (seconds), throughputs (per second), and accuracy
+        (how often the decoded move is closest to the right direction) and mean angle
+        (degrees) between the decoded move and the right direction. If selecting
+        channels, also the fraction of direction-tuned channels that were picked
+    """
+    players = SimulatedPlayers(
+        numPlayers,
+        numChannels=numChannels,
+        randGenerator=np.random.default_rng(randSeed),
+    )
+    numTicks = numCalibrationTicks + numTestTicks
+
+    startTime = time.perf_counter()
+    directionCodes = players.randomDirectionCodes(numTicks, meanRunLength)
+    measurements = players.measure(directionCodes)
+    simulationTime = time.perf_counter() - startTime
+
+    decoders = [
+        Decoder(
+            inputShape=(numChannels,),
+            mode=decoderMode,
+            selectionMethod=selectionMethod,
+            numSelectedInputs=numSelectedInputs,
+        )
+        for _ in range(numPlayers)
+    ]
+    startTime = time.perf_counter()
+    for playerIdx, decoder in enumerate(decoders):
+        decoder.addManyToTrainingData(
+            measurements[playerIdx, :numCalibrationTicks],
+            directionCodes[playerIdx, :numCalibrationTicks],
+        )
+        decoder.train()
+    trainingTime = time.perf_counter() - startTime
+
+    testMeasurements = measurements[:, numCalibrationTicks:]
+    testCodes = directionCodes[:, numCalibrationTicks:]
+    # Decode tick by tick, as Player would, interleaving all the players.
+    startTime = time.perf_counter()
+    for tickIdx in range(numTestTicks):
+        for playerIdx, decoder in enumerate(decoders):
+            decoder.decode(testMeasurements[playerIdx, tickIdx])
+    decodeTime = time.perf_counter() - startTime
+    # Decode each player's ticks all at once, as when replaying a logged run.
+    startTime = time.perf_counter()
+    gameCommandsPerPlayer = [
+        decoder.decodeMany(testMeasurements[playerIdx])
+        for playerIdx, decoder in enumerate(decoders)
+    ]
+    decodeManyTime = time.perf_counter() - startTime
+
+    # Compare the decoded moves with the right directions. (Moves may be continuous,
+    # as in "kalman" mode, so compare directions, not exact moves.)
+    moves = np.array(
+        [
+            [(command["move"]["x"], command["move"]["y"]) for command in gameCommands]
+            for gameCommands in gameCommandsPerPlayer
+        ]
+    )
+    rightMoves = DIRECTION_VELOCITIES[testCodes]
+    numCorrect = np.count_nonzero(
+        (moves @ DIRECTION_VELOCITIES.T).argmax(axis=2) == testCodes
+    )
+    angles = np.arctan2(moves[..., 1], moves[..., 0]) - np.arctan2(
+        rightMoves[..., 1], rightMoves[..., 0]
+    )
+    # Wrap to [-pi, pi) before taking the size of the angle.
+    angles = np.abs((angles + np.pi) % (2 * np.pi) - np.pi)
+
+    numSamples = numPlayers * numTicks
+    numTestSamples = numPlayers * numTestTicks
+    results = {
+        "simulationTime": simulationTime,
+        "simulatedSamplesPerSecond": numSamples / simulationTime,
+        "trainingTime": trainingTime,
+        "trainingTimePerDecoder": trainingTime / numPlayers,
+        "decodeTime": decodeTime,
+        "decodesPerSecond": numTestSamples / decodeTime,
+        "decodeManyTime": decodeManyTime,
+        "decodeManySamplesPerSecond": numTestSamples / decodeManyTime,
+        "accuracy": numCorrect / numTestSamples,
+        "meanAngleError": np.degrees(angles.mean()),
+    }
+    if selectionMethod is not None:
+        numTunedSelected = sum(
+            np.isin(tunedIndices, decoder.selectedInputs).sum()
+            for tunedIndices, decoder in zip(players.directionTunedIndices, decoders)
+        )
+        results["tunedChannelsSelected"] = (
+            numTunedSelected / players.directionTunedIndices.size
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test decoders on many simulated players."
+    )
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--calibration-ticks", type=int, default=300)
+    parser.add_argument("--test-ticks", type=int, default=1000)
+    parser.add_argument("--channels", type=int, default=192)
+    parser.add_argument(
+        "--decoder-mode",
+        nargs="+",
+        default=["batch"],
+        choices=["batch", "online", "kalman"],
+        help="one or more decoder modes to compare on the same simulated players",
+    )
+    parser.add_argument(
+        "--mean-run-length",
+        type=float,
+        default=1,
+        help="average ticks in a row the same direction is needed (1 is independent "
+        "ticks, which gives a decoder nothing to smooth over)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--selection-method",
+        choices=SELECTION_METHODS,
+        default=None,
+        help="train each decoder on only the channels picked this way",
+    )
+    parser.add_argument("--selected-inputs", type=int, default=16)
+    args = parser.parse_args()
+
+    resultsPerMode = {
+        decoderMode: benchmarkDecoders(
+            args.players,
+            args.calibration_ticks,
+            args.test_ticks,
+            numChannels=args.channels,
+            decoderMode=decoderMode,
+            meanRunLength=args.mean_run_length,
+            randSeed=args.seed,
+            selectionMethod=args.selection_method,
+            numSelectedInputs=args.selected_inputs,
+        )
+        for decoderMode in args.decoder_mode
+    }
+    # One column per decoder mode.
+    print(f"{'':<28}" + "".join(f"{mode:>14}" for mode in resultsPerMode))
+    for name in next(iter(resultsPerMode.values())):
+        values = [results[name] for results in resultsPerMode.values()]
+        print(f"{name:<28}" + "".join(f"{value:>14.6g}" for value in values))
+
+
+if __name__ == "__main__":
+    main()
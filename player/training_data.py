@@ -0,0 +1,188 @@
+import numpy as np
+
+
+# The classes a sample can be labeled with. Labels are stored as their index in this
+# tuple (e.g. "right" is stored as 1).
+DIRECTIONS = ("up", "right", "down", "left")
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+
+class TrainingData:
+    """Growable store of labeled training samples.
+
+    Samples live in a preallocated array whose capacity doubles when it fills up, so
+    adding a sample is amortized O(1) instead of copying everything stored so far.
+    Labels are stored as integer codes (see DIRECTION_CODES).
+
+    Optionally, the store can be capped at a maximum number of samples, in which case
+    new samples either replace the oldest ones ("window") or replace random ones so the
+    store stays a uniform sample of everything ever added ("reservoir").
+    """
+
+    def __init__(
+        self, inputShape, initialCapacity=1024, maxSize=None, evictionPolicy="window"
+    ):
+        """
+        :param tuple[int] inputShape: shape of each sample (e.g. (192,))
+        :param int initialCapacity: how many samples to make room for up front
+        :param int|None maxSize: most samples to keep at once, or None for no limit
+        :param str evictionPolicy: "window" to keep the most recent maxSize samples, or
+            "reservoir" to keep a uniformly random maxSize of all samples
+        """
+        if evictionPolicy not in ("window", "reservoir"):
+            raise ValueError(f"Unknown eviction policy: {evictionPolicy}")
+
+        self.inputShape = tuple(inputShape)
+        self.maxSize = maxSize
+        self.evictionPolicy = evictionPolicy
+        self.randGenerator = np.random.default_rng()
+
+        capacity = initialCapacity
+        if self.maxSize is not None:
+            capacity = min(capacity, self.maxSize)
+        capacity = max(capacity, 1)
+        self._inputs = np.empty((capacity, *self.inputShape))
+        self._codes = np.empty(capacity, dtype=np.int8)
+        # For each slot, the count of samples ever added at the time this slot's sample
+        # was added (i.e. the sample's position in the stream of all samples).
+        self._addedAt = np.empty(capacity, dtype=np.int64)
+
+        # How many samples are currently stored.
+        self.size = 0
+        # How many samples have ever been added (including evicted ones).
+        self.numAdded = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self._inputs)
+
+    @property
+    def inputs(self):
+        """View (not a copy) of the stored samples, shape (size, *inputShape)."""
+        return self._inputs[: self.size]
+
+    @property
+    def codes(self):
+        """View (not a copy) of the stored labels as integer codes, shape (size,)."""
+        return self._codes[: self.size]
+
+    @property
+    def answers(self):
+        """The stored labels as strings (e.g. "up"), shape (size,)."""
+        return np.array(DIRECTIONS)[self.codes]
+
+    def add(self, inp, ans):
+        """Store a single labeled sample.
+
+        :param np.array inp: array of shape self.inputShape
+        :param str ans: "up", "right", "down", or "left"
+        """
+        slot = self._getSlotForNewSample()
+        if slot is not None:
+            self._inputs[slot] = inp
+            self._codes[slot] = DIRECTION_CODES[ans]
+            self._addedAt[slot] = self.numAdded
+        self.numAdded += 1
+
+    def extend(self, inps, answers):
+        """Store many labeled samples at once.
+
+        :param np.array inps: array of shape (n, *self.inputShape)
+        :param list[str]|np.array answers: n labels, each "up", "right", "down", or
+            "left", or an integer array of n label codes
+        """
+        inps = np.asarray(inps)
+        if isinstance(answers, np.ndarray) and answers.dtype.kind in "iu":
+            codes = answers.astype(np.int8)
+            answers = [DIRECTIONS[code] for code in codes]
+        else:
+            codes = np.array([DIRECTION_CODES[ans] for ans in answers], dtype=np.int8)
+        # Fast path for when everything fits without evicting, which covers the usual
+        # case of bulk loading a run from a log file.
+        numNew = len(inps)
+        newSize = self.size + numNew
+        if self.maxSize is None or newSize <= self.maxSize:
+            self._reserve(newSize)
+            self._inputs[self.size : newSize] = inps
+            self._codes[self.size : newSize] = codes
+            self._addedAt[self.size : newSize] = np.arange(
+                self.numAdded, self.numAdded + numNew
+            )
+            self.size = newSize
+            self.numAdded += numNew
+            return
+        for inp, ans in zip(inps, answers):
+            self.add(inp, ans)
+
+    def samplesSince(self, numAdded, limit=None):
+        """Get the stored samples that were added after a given point in the stream of
+        all added samples, oldest first.
+
+        Samples added after that point but since evicted are not returned.
+
+        :param int numAdded: a past value of self.numAdded
+        :param int|None limit: most samples to return
+
+        :return (np.array, np.array, int): inputs and integer-coded labels of the
+            samples, and the value of numAdded to pass next time to continue right
+            after the returned samples
+        """
+        numNew = self.numAdded - numAdded
+        if numNew <= 0:
+            return self._inputs[:0], self._codes[:0], self.numAdded
+        # Without eviction, samples are stored in the order they were added.
+        if self.maxSize is None or self.numAdded <= self.maxSize:
+            start = max(self.size - numNew, 0)
+            end = self.size if limit is None else min(self.size, start + limit)
+            nextNumAdded = self.numAdded - (self.size - end)
+            return self._inputs[start:end], self._codes[start:end], nextNumAdded
+        (slots,) = np.nonzero(self._addedAt[: self.size] >= numAdded)
+        slots = slots[np.argsort(self._addedAt[slots])]
+        nextNumAdded = self.numAdded
+        if limit is not None and len(slots) > limit:
+            slots = slots[:limit]
+            nextNumAdded = self._addedAt[slots[-1]] + 1
+        return self._inputs[slots], self._codes[slots], nextNumAdded
+
+    def clear(self):
+        """Remove all stored samples (keeping the allocated capacity)."""
+        self.size = 0
+        self.numAdded = 0
+
+    def _getSlotForNewSample(self):
+        """Decide where the next sample goes, making room for it if needed.
+
+        :return int|None slot: index to write the sample at, or None if the sample
+            should be dropped
+        """
+        if self.maxSize is None or self.size < self.maxSize:
+            self._reserve(self.size + 1)
+            slot = self.size
+            self.size += 1
+            return slot
+        if self.evictionPolicy == "window":
+            # Slots are filled in order, so the oldest sample is always the one at the
+            # slot after the most recently written one.
+            return self.numAdded % self.maxSize
+        # Reservoir sampling: the (n+1)th sample replaces a random stored one with
+        # probability maxSize / (n+1).
+        idx = self.randGenerator.integers(self.numAdded + 1)
+        return idx if idx < self.maxSize else None
+
+    def _reserve(self, size):
+        """Make sure the backing arrays can hold at least `size` samples."""
+        if size <= self.capacity:
+            return
+        newCapacity = self.capacity
+        while newCapacity < size:
+            newCapacity *= 2
+        if self.maxSize is not None:
+            newCapacity = min(newCapacity, self.maxSize)
+        for name in ("_inputs", "_codes", "_addedAt"):
+            old = getattr(self, name)
+            new = np.empty((newCapacity, *old.shape[1:]), dtype=old.dtype)
+            new[: self.size] = old[: self.size]
+            setattr(self, name, new)
@@ -0,0 +1,312 @@
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# Bytes at the start of a SharedRing's memory, holding how many samples have ever been
+# appended (an int64).
+RING_HEADER_SIZE = 8
+
+
+class SharedRing:
+    """Fixed-length history of samples in shared memory, appended to by one process and
+    read by others.
+
+    Appending is just a copy into the memory and a bump of a count of the samples ever
+    appended, with no locks or messages, so it costs the writer about as much as
+    appending to a RingBuffer. The count is bumped after each sample is written, so a
+    reader can tell which of the samples it copied may have been overwritten while it
+    was copying, and leave them out.
+    """
+
+    def __init__(self, length, numColumns, name=None):
+        """
+        :param int length: how many samples to remember
+        :param int numColumns: size of each sample
+        :param str|None name: name of the shared memory of an existing SharedRing to
+            attach to (see self.name), or None to create new shared memory
+        """
+        self.length = length
+        self.numColumns = numColumns
+        # One more slot than the length, so that the sample being written never
+        # overwrites one of the latest length samples.
+        self._numSlots = self.length + 1
+        self.isOwner = name is None
+        if self.isOwner:
+            self._sharedMemory = shared_memory.SharedMemory(
+                create=True, size=RING_HEADER_SIZE + self._numSlots * numColumns * 8
+            )
+        else:
+            self._sharedMemory = shared_memory.SharedMemory(name=name)
+        self.name = self._sharedMemory.name
+        self._sharedNumAppended = np.ndarray(
+            (1,), dtype=np.int64, buffer=self._sharedMemory.buf
+        )
+        self._data = np.ndarray(
+            (self._numSlots, numColumns),
+            dtype=np.float64,
+            buffer=self._sharedMemory.buf,
+            offset=RING_HEADER_SIZE,
+        )
+        # How many samples have ever been appended (only kept up to date in the
+        # appending process, which is the only one that may append).
+        self.numAppended = 0
+        if self.isOwner:
+            self._sharedNumAppended[0] = 0
+
+    def append(self, sample, columns=None):
+        """Add a sample, forgetting the oldest one if already full.
+
+        :param np.array sample: array of shape (numColumns,), or of any length if
+            columns is given
+        :param np.array|None columns: if given, the indices of the values of sample to
+            append (picked without making an intermediate copy)
+        """
+        slot = self._data[self.numAppended % self._numSlots]
+        if columns is None:
+            slot[:] = sample
+        else:
+            np.take(sample, columns, out=slot)
+        self.numAppended += 1
+        self._sharedNumAppended[0] = self.numAppended
+
+    def read(self):
+        """Copy the remembered samples, oldest first.
+
+        :return (np.array, int): shape (numSamples, numColumns), and how many samples
+            had ever been appended as of the latest of them
+        """
+        numAppended = int(self._sharedNumAppended[0])
+        numSamples = min(numAppended, self.length)
+        slots = np.arange(numAppended - numSamples, numAppended) % self._numSlots
+        samples = self._data[slots]
+        # While writing sample i, the writer overwrites sample i - numSlots, so
+        # anything older than the latest length samples as of now may be torn.
+        numAppendedSince = int(self._sharedNumAppended[0]) - numAppended
+        numIntact = max(min(numSamples, self.length - numAppendedSince), 0)
+        return samples[numSamples - numIntact :], numAppended
+
+    def close(self):
+        """Detach from the shared memory, and free it if this created it."""
+        # Drop the arrays first, since the memory can't be closed while they use it.
+        self._sharedNumAppended = None
+        self._data = None
+        self._sharedMemory.close()
+        if self.isOwner:
+            self._sharedMemory.unlink()
+
+
+def decimateMinMax(samples, maxNumPoints, firstIndex=0):
+    """Shrink a time series to about maxNumPoints points, by splitting it into buckets
+    and keeping each bucket's minimum and maximum. Unlike keeping every nth sample, this
+    keeps spikes when plotted, since a bucket is narrower than a pixel anyway.
+
+    :param np.array samples: shape (numSamples, numColumns)
+    :param int maxNumPoints: about how many points to keep (at most a bucket's worth
+        more, since the latest samples, short of a full bucket, are kept as is)
+    :param int firstIndex: index of the first sample in the whole series. Buckets start
+        at multiples of the bucket size, so that as the series scrolls by, a sample
+        stays in the same bucket (or the plot shimmers)
+
+    :return (np.array, np.array): the index of each point, shape (numPoints,), and the
+        points, shape (numPoints, numColumns)
+    """
+    numSamples, numColumns = samples.shape
+    if numSamples <= maxNumPoints:
+        return np.arange(firstIndex, firstIndex + numSamples), samples
+
+    bucketSize = -(-2 * numSamples // maxNumPoints)
+    # Leave out the oldest samples, short of a full bucket, to align the buckets.
+    start = -firstIndex % bucketSize
+    numBuckets = (numSamples - start) // bucketSize
+    end = start + numBuckets * bucketSize
+    buckets = samples[start:end].reshape(numBuckets, bucketSize, numColumns)
+    numLatest = numSamples - end
+
+    points = np.empty((2 * numBuckets + numLatest, numColumns))
+    buckets.min(axis=1, out=points[0 : 2 * numBuckets : 2])
+    buckets.max(axis=1, out=points[1 : 2 * numBuckets : 2])
+    points[2 * numBuckets :] = samples[end:]
+    indices = np.empty(len(points), dtype=np.int64)
+    bucketStarts = firstIndex + start + bucketSize * np.arange(numBuckets)
+    indices[0 : 2 * numBuckets : 2] = bucketStarts
+    indices[1 : 2 * numBuckets : 2] = bucketStarts + bucketSize - 1
+    indices[2 * numBuckets :] = np.arange(firstIndex + end, firstIndex + numSamples)
+    return indices, points
+
+
+def runVisualization(
+    ringName,
+    windowLength,
+    channelLabels,
+    yLimits,
+    refreshInterval,
+    maxPointsPerLine,
+    stopEvent,
+):
+    """Chart the samples in a SharedRing until stopped or the window is closed. Meant
+    to be the target of a process (see Visualizer).
+
+    Only the lines are redrawn each refresh, over a saved image of everything else
+    (blitting), and each line is decimated to at most about maxPointsPerLine points.
+
+    :param str ringName: name of the SharedRing's shared memory
+    :param int windowLength: the SharedRing's length
+    :param list[str] channelLabels: label of each of the SharedRing's columns
+    :param (float, float) yLimits: range of values to show
+    :param float refreshInterval: seconds between refreshes
+    :param int maxPointsPerLine: see decimateMinMax
+    :param multiprocessing.Event stopEvent: set to stop
+    """
+    # Imported here, since only this process draws.
+    from matplotlib import pyplot as plt
+    from matplotlib import ticker
+
+    ring = SharedRing(windowLength, len(channelLabels), name=ringName)
+    numCharts = len(channelLabels)
+    # Charts are stacked without gaps (and taller figures for more of them, up to a
+    # point), so that many channels still fit, though then they're too short for y
+    # ticks.
+    isCrowded = numCharts > 8
+    fig, axs = plt.subplots(
+        numCharts,
+        sharex=True,
+        squeeze=False,
+        figsize=(6.4, min(max(4.8, 0.4 * numCharts), 10)),
+        gridspec_kw={"hspace": 0},
+    )
+    axs = axs[:, 0]
+    fig.suptitle("Recent Measurements")
+    lines = []
+    for ax, label in zip(axs, channelLabels):
+        # Labeled inside the chart, since with many channels the charts are short.
+        ax.text(
+            0.01,
+            0.95,
+            label,
+            transform=ax.transAxes,
+            verticalalignment="top",
+            fontsize="small" if isCrowded else None,
+        )
+        ax.set_xlim((-windowLength + 1, 0))
+        ax.set_ylim(yLimits)
+        if isCrowded:
+            ax.set_yticks([])
+        else:
+            # Leave off the ticks at the limits, which would overlap the next chart's.
+            ax.yaxis.set_major_locator(ticker.MaxNLocator(nbins=3, prune="both"))
+        # Animated lines are left out of full redraws, to be drawn only by blitting.
+        (line,) = ax.plot([], [], animated=True)
+        lines.append(line)
+    axs[-1].set_xlabel("samples ago")
+
+    background = None
+
+    def drawLines():
+        for line in lines:
+            line.axes.draw_artist(line)
+
+    def onDraw(event):
+        # Save everything but the lines, whenever it is all redrawn (e.g. on resize).
+        nonlocal background
+        background = fig.canvas.copy_from_bbox(fig.bbox)
+        drawLines()
+
+    fig.canvas.mpl_connect("draw_event", onDraw)
+    plt.show(block=False)
+    fig.canvas.draw()
+
+    numAppendedShown = 0
+    try:
+        while not stopEvent.is_set() and plt.fignum_exists(fig.number):
+            samples, numAppended = ring.read()
+            if numAppended != numAppendedShown and len(samples) > 0:
+                firstIndex = numAppended - len(samples)
+                indices, points = decimateMinMax(samples, maxPointsPerLine, firstIndex)
+                # Index relative to the latest sample, so the axes never scroll.
+                indices -= numAppended - 1
+                for idx, line in enumerate(lines):
+                    line.set_data(indices, points[:, idx])
+                fig.canvas.restore_region(background)
+                drawLines()
+                fig.canvas.blit(fig.bbox)
+                numAppendedShown = numAppended
+            fig.canvas.flush_events()
+            time.sleep(refreshInterval)
+    finally:
+        plt.close(fig)
+        ring.close()
+
+
+class Visualizer:
+    """Real-time charts of some channels of the measurements, drawn by a separate
+    process, so that drawing never holds up taking measurements.
+
+    Each measurement's charted channels are appended to a SharedRing, which the drawing
+    process reads on its own schedule.
+    """
+
+    def __init__(
+        self,
+        channels,
+        channelLabels=None,
+        windowLength=1000,
+        yLimits=(0, 1),
+        refreshInterval=1 / 30,
+        maxPointsPerLine=1000,
+    ):
+        """
+        :param list[int] channels: indices of the channels of each measurement to chart
+        :param list[str]|None channelLabels: label of each chart, or None to label them
+            by channel index
+        :param int windowLength: how many of the latest measurements to chart
+        :param (float, float) yLimits: range of values to show
+        :param float refreshInterval: seconds between redraws
+        :param int maxPointsPerLine: about the most points to draw for each channel (a
+            long window is decimated, keeping each stretch's minimum and maximum)
+        """
+        self.channels = np.asarray(channels)
+        if channelLabels is None:
+            channelLabels = [f"Channel {channelIdx}" for channelIdx in self.channels]
+        self.ring = SharedRing(windowLength, len(self.channels))
+        # Spawned rather than forked, so the drawing process doesn't inherit this one's
+        # threads and event loop.
+        context = multiprocessing.get_context("spawn")
+        self.stopEvent = context.Event()
+        self.process = context.Process(
+            target=runVisualization,
+            args=(
+                self.ring.name,
+                windowLength,
+                list(channelLabels),
+                yLimits,
+                refreshInterval,
+                maxPointsPerLine,
+                self.stopEvent,
+            ),
+            # Don't outlive this process.
+            daemon=True,
+        )
+        self.process.start()
+
+    def append(self, measurements):
+        """Hand a measurement to the drawing process.
+
+        :param np.array measurements: shape (numChannels,)
+        """
+        self.ring.append(measurements, self.channels)
+
+    def close(self, timeout=1):
+        """Stop the drawing process, and free the shared memory.
+
+        :param float timeout: seconds to wait for the drawing process to stop before
+            killing it
+        """
+        self.stopEvent.set()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.ring.close()
@@ -0,0 +1,155 @@
+import json
+import struct
+
+
+# WebSocket subprotocols the player's server can speak, in order of preference. A
+# client that asks for the binary subprotocol sends GAME_UPDATE messages, and receives
+# GAME_COMMAND messages, as the fixed-layout binary frames below. Every other message
+# (and every message on a connection without a negotiated subprotocol) is JSON.
+BINARY_SUBPROTOCOL = "decoder-game-binary-v1"
+JSON_SUBPROTOCOL = "decoder-game-json"
+SUBPROTOCOLS = [BINARY_SUBPROTOCOL, JSON_SUBPROTOCOL]
+
+# Ways a PYTHON_CODE message's code can be evaluated (its PAYLOAD's "mode"; the first is
+# the default).
+#   snapshot: read-only, against a snapshot of the player's state, while it keeps
+#       running (see Player.makeInspectionSnapshot)
+#   live: against the player itself, while it keeps running
+#   pause: against the player itself, after pausing it (until the code
+#       "self.unpause()" is sent)
+INSPECTION_MODES = ("snapshot", "live", "pause")
+
+# First byte of each binary frame, saying which TYPE of message it is.
+GAME_UPDATE_CODE = 1
+GAME_COMMAND_CODE = 2
+
+# Flags byte of a GAME_UPDATE frame.
+IS_CALIBRATING_FLAG = 0b1
+
+# All fields little-endian. See the WebSocket API section of player/README.md.
+#   GAME_UPDATE: type code (uint8), flags (uint8), 2 bytes padding, timestamp (float64,
+#       ms since the Unix epoch), then playerCursor x, y, radius and target x, y, radius
+#       (float32 each)
+GAME_UPDATE_STRUCT = struct.Struct("<BBxxd6f")
+#   GAME_COMMAND: type code (uint8), 3 bytes padding, timestamp (float64, ms since the
+#       Unix epoch), then move x, y (float32 each)
+GAME_COMMAND_STRUCT = struct.Struct("<B3xd2f")
+
+# How JSON GAME_UPDATE messages start (as made by JSON.stringify in the game, or by
+# json.dumps), so they can be recognized without being parsed.
+GAME_UPDATE_JSON_PREFIXES = ('{"TYPE":"GAME_UPDATE"', '{"TYPE": "GAME_UPDATE"')
+
+
+def isBinaryConnection(websocket):
+    """Whether messages on this connection use the binary format.
+
+    :param websockets.WebSocketServerProtocol websocket:
+
+    :return bool:
+    """
+    return websocket.subprotocol == BINARY_SUBPROTOCOL
+
+
+def isGameUpdate(message):
+    """Whether a message is a GAME_UPDATE, without parsing it.
+
+    :param str|bytes message: a WebSocket message
+
+    :return bool:
+    """
+    if isinstance(message, bytes):
+        return len(message) > 0 and message[0] == GAME_UPDATE_CODE
+    return message.startswith(GAME_UPDATE_JSON_PREFIXES)
+
+
+def decodeMessage(message):
+    """Parse a message, whether binary or JSON.
+
+    :param str|bytes message: a WebSocket message
+
+    :return dict messageDict: keys "TYPE" and "PAYLOAD"
+    """
+    if isinstance(message, bytes):
+        return decodeBinaryMessage(message)
+    return json.loads(message)
+
+
+def decodeBinaryMessage(data):
+    """Turn a binary frame into the same kind of dict a JSON message is parsed into.
+
+    :param bytes data: a binary WebSocket message
+
+    :return dict messageDict: keys "TYPE" and "PAYLOAD". The PAYLOAD of a GAME_UPDATE
+        has "timestamp" (ms since the Unix epoch) instead of "timestring".
+    """
+    typeCode = data[0]
+    if typeCode == GAME_UPDATE_CODE:
+        (
+            _,
+            flags,
+            timestamp,
+            cursorX,
+            cursorY,
+            cursorRadius,
+            targetX,
+            targetY,
+            targetRadius,
+        ) = GAME_UPDATE_STRUCT.unpack(data)
+        gameState = {
+            "playerCursor": {"x": cursorX, "y": cursorY, "radius": cursorRadius},
+            "target": {"x": targetX, "y": targetY, "radius": targetRadius},
+            "isCalibrating": bool(flags & IS_CALIBRATING_FLAG),
+        }
+        return {
+            "TYPE": "GAME_UPDATE",
+            "PAYLOAD": {"gameState": gameState, "timestamp": timestamp},
+        }
+    raise ValueError(f"Unrecognized binary message type code: {typeCode}")
+
+
+def encodeGameUpdate(gameState, timestamp):
+    """Make a binary GAME_UPDATE frame.
+
+    :param dict gameState: see game/README.md
+    :param float timestamp: ms since the Unix epoch
+
+    :return bytes:
+    """
+    flags = IS_CALIBRATING_FLAG if gameState["isCalibrating"] else 0
+    playerCursor = gameState["playerCursor"]
+    target = gameState["target"]
+    return GAME_UPDATE_STRUCT.pack(
+        GAME_UPDATE_CODE,
+        flags,
+        timestamp,
+        playerCursor["x"],
+        playerCursor["y"],
+        playerCursor["radius"],
+        target["x"],
+        target["y"],
+        target["radius"],
+    )
+
+
+def encodeGameCommand(gameCommand, timestamp):
+    """Make a binary GAME_COMMAND frame.
+
+    :param dict gameCommand: see game/README.md (without "timestring")
+    :param float timestamp: ms since the Unix epoch
+
+    :return bytes:
+    """
+    move = gameCommand["move"]
+    return GAME_COMMAND_STRUCT.pack(GAME_COMMAND_CODE, timestamp, move["x"], move["y"])
+
+
+def decodeGameCommand(data):
+    """Turn a binary GAME_COMMAND frame back into a game command.
+
+    :param bytes data:
+
+    :return dict gameCommand: with "timestamp" (ms since the Unix epoch) instead of
+        "timestring"
+    """
+    _, timestamp, moveX, moveY = GAME_COMMAND_STRUCT.unpack(data)
+    return {"move": {"x": moveX, "y": moveY}, "timestamp": timestamp}